@@ -132,8 +132,8 @@ client = Client(account_sid, auth_token)
 
 #This step ensures that you are authenticated correctly.
 
-r = requests.get('http://api.open-notify.org/astros.json')
-people = r.json()
+from api_cache import get_json
+people = get_json('http://api.open-notify.org/astros.json')
 number_iss = people['number']
 Message = 'Bruh...the number of people in space right now is '+str(number_iss)
 
@@ -142,12 +142,29 @@ Message = 'Bruh...the number of people in space right now is '+str(number_iss)
 #number of people can be retrieved by accessing the ['number'] key. We store
 #this number and formulate a message for our friend.
 
-message = client.messages.create(
-    to='Your_Number',
-    from_="Your_other_number",
-    body=Message)
-
-print(message.sid)
+#This time we go through get_json from api_cache instead of requests.get. The
+#crew only changes a few times a year, so get_json keeps the decoded answer
+#for a while and makes sure that lots of requests for it at once turn into one
+#call to Open Notify. The cache only lives as long as this process, though:
+#the requests.get of /astros.json near the top of this script still makes its
+#own call, and so does Dataquest_API_tutorial.py when it runs.
+
+from change_detect import ChangeDetector
+astros_changes = ChangeDetector('astros_fingerprint.txt',
+                                fields=['number', 'people'])
+#Which crew change this is: from the crew we last texted about to this one.
+#Worked out before remember() below replaces the saved fingerprint.
+change_id = '%s:%s' % (astros_changes.last_fingerprint(),
+                       astros_changes.fingerprint(people))
+
+if astros_changes.changed(people):
+    message = client.messages.create(
+        to='Your_Number',
+        from_="Your_other_number",
+        body=Message)
+
+    print(message.sid)
+    astros_changes.remember(people)
 
 #Now comes the centerpiece of our assignment, formulation the message and
 #sending it. In here to is the number which you would like to send a message to,
@@ -156,4 +173,31 @@ print(message.sid)
 #send it to your friend verify the number in twilio). Replace the values
 #correctly, and in this step we also indicate what the body of the message
 #should contain, in our case the text from our variable Message: Number of
-#people in space now.
\ No newline at end of file
+#people in space now.
+
+#We only send the text when the crew has actually changed. ChangeDetector
+#hashes the number and people fields of the astros.json response and compares
+#the hash with the one saved the last time we sent a message. If this script
+#runs on a schedule, most runs just make one GET and send nothing. We save the
+#new hash only after the message goes out, so a failed send is tried again
+#next time.
+
+#To send the message to a whole list of friends, sms_dispatcher sends to
+#several numbers at once while staying under Twilio's sending rate, skips
+#duplicate numbers, and remembers who already got this crew change so running
+#the script again doesn't text them twice:
+
+#from sms_dispatcher import NotificationDispatcher, twilio_client_sender
+#dispatcher = NotificationDispatcher(twilio_client_sender(client),
+                                    #"Your_other_number")
+#print(dispatcher.dispatch(['Your_Number', 'Your_friends_number'], Message,
+                          #message_id=change_id))
+
+#All we've looked at so far is response.status_code. api_metrics records the
+#latency, bytes, retries and rate limit headroom of every call made with
+#requests (GitHub, Open Notify, Datamuse, ...), and how often get_json is
+#answered from its cache, and serves them for Prometheus on
+#http://127.0.0.1:8000/metrics:
+
+#import api_metrics
+#api_metrics.start(port=8000)
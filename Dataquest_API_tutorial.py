@@ -226,3 +226,47 @@ data = response.json()
 #6 people are currently in space.
 print(data["number"])
 print(data)
+
+
+#Tracking the ISS over time
+
+#The iss-now.json endpoint only tells us where the space station is right now.
+#To follow it over time, iss_tracker polls the endpoint every few seconds over
+#one open connection, skips readings it already has, and stores the positions
+#compactly on disk so we can ask where the ISS was between two times:
+
+#from iss_tracker import ISSTracker, PositionStore
+#store = PositionStore("iss_positions")
+#tracker = ISSTracker(store, interval=5)
+#tracker.run(polls=120)
+#print(store.between(store.last_timestamp - 300, store.last_timestamp))
+
+#Caching pass predictions
+
+#People a few miles apart see the ISS pass overhead at nearly the same time.
+#iss_pass_cache rounds each location to a grid cell and shares one
+#iss-pass.json response between everyone in the cell, keeping it until the
+#first predicted pass has happened:
+
+#from iss_pass_cache import PassPredictionCache
+#passes = PassPredictionCache(grid=0.5)
+#print(passes.passes(40.71, -74))
+#print(passes.passes(40.73, -73.99))
+#print(passes.upstream_calls)
+
+#The crew on the ISS only changes a few times a year, so there's no need to ask
+#astros.json again every time. api_cache.get_json caches the decoded response
+#and folds simultaneous requests for the same URL into one:
+
+#from api_cache import get_json
+#print(get_json("http://api.open-notify.org/astros.json")["number"])
+
+#Open Notify usually answers quickly, but every so often a request takes much
+#longer. api_http can hedge GETs: when a request is slower than 95% of recent
+#ones to the same endpoint, it sends it again and takes whichever answer comes
+#first (get_json above goes through api_http too):
+
+#import api_http
+#api_http.enable_hedging()
+#response = api_http.get("http://api.open-notify.org/iss-now.json")
+#print(api_http.getter.stats())
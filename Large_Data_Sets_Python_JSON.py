@@ -159,6 +159,16 @@ for item in good_columns:
 #Now that we’ve read the data in, we can print out the first item in data:
 print(data[0])
 
+#Reading every row just to get a first look at the data takes a long time on
+#a big export. traffic_sampling streams through the file once and keeps a
+#random sample, either of the whole file or of each subagency (or year), which
+#is plenty for exploring. The same seed always gives the same sample:
+
+from traffic_sampling import sample_rows, stop_year, stratified_sample
+sample = sample_rows(5000, filename, seed=42)
+by_subagency = stratified_sample(500, by="subagency", filename=filename, seed=42)
+by_year = stratified_sample(500, by=stop_year, filename=filename, seed=42)
+
 
 #Reading the data into Pandas
 #Now that we have the data as a list of lists, and the column headers as a lits,
@@ -184,6 +194,25 @@ stops["arrest_type"].value_counts()
 #With the rise of red light cameras and speed lasers, it's interesting that
 #patrol cars are still by far the dominant source of citations.
 
+#Both of those tables needed the whole file loaded into stops first. When the
+#file is too big for that, traffic_sketches can answer the same questions in
+#one pass straight off the ijson stream, in a fixed amount of memory. The
+#counts it reports can be slightly off, but it tells us by how much at most:
+
+from traffic_sketches import summarize
+summaries = summarize(filename, columns=["color", "arrest_type", "violation_type"])
+print(summaries["color"].report(k=10))
+print(summaries["arrest_type"].report(k=5))
+
+#make, model and color are typed in by hand, so the same value is spelled
+#several ways ("TOYOTA", "TOYT", "TOYO") and the counts get split between
+#them. traffic_normalize maps every spelling to one canonical value. It only
+#works out each distinct spelling once, however many stops use it:
+
+from traffic_normalize import normalize_frame
+stops = normalize_frame(stops, columns=["make", "model", "color"])
+print(stops["make"].value_counts())
+
 #Converting columns
 
 #We're now almost ready to do some time and location based analysis, but we
@@ -232,6 +261,22 @@ plt.show()
 #issue, and poking through the time_of_stop column will be necessary to get the
 #full answer.
 
+#Both histograms (and the rush hour filter below) go back over every row of
+#stops each time. traffic_cube counts the stops once by hour, weekday,
+#subagency and violation type and saves the counts to disk, so the same
+#plots can be drawn from a small array. New batches of rows can be added to
+#the saved cube with update() instead of rebuilding it:
+
+from traffic_cube import WEEKDAYS, StopCube
+cube = StopCube.from_file(filename)
+cube.save("md_traffic_cube.npz")
+cube = StopCube.load("md_traffic_cube.npz")
+plt.bar(WEEKDAYS, cube.by_weekday())
+plt.show()
+plt.bar(range(24), cube.by_hour(violation_types="Citation"))
+plt.show()
+print(cube.morning_rush(subagencies="3rd district, Silver Spring"))
+
 
 #Subsetting the stops
 #Now that we've converted the location and date columns, we can map out the
@@ -268,4 +313,39 @@ stops_heatmap = folium.Map(location=[39.0836, -77.1483],
 zoom_start=11)stops_heatmap.add_children(plugins.HeatMap([[row["longitude"],
 row["latitude"]]
 for name, row in morning_rush.iloc[:1000].iterrows()]))
-stops_heatmap.save("heatmap.html")stops_heatmap
\ No newline at end of file
+stops_heatmap.save("heatmap.html")stops_heatmap
+#The maps only show the first 1000 stops. To tell whether speed traps are
+#common we want to look at all of them. traffic_spatial puts every stop on a
+#grid, so we can ask for the stops near a point or in a box, or for the grid
+#cells with the most speeding stops, in milliseconds:
+
+from traffic_spatial import StopIndex, parse_coordinates
+index = StopIndex(parse_coordinates(stops["latitude"]),
+                  parse_coordinates(stops["longitude"]),
+                  description=stops["description"],
+                  violation_type=stops["violation_type"])
+speeding = lambda description: "EXCEEDING" in description
+for count, (south, west, north, east) in index.hotspots(10, description=speeding):
+    print(count, south, west)
+near_here = stops.iloc[index.radius(39.0836, -77.1483, 500)]
+
+#Every one of these analyses starts from stops, so they all need the whole
+#file read in first. traffic_store loads the rows into a SQLite database once,
+#with indexes on the date, hour, subagency and location, and then each
+#question only reads the rows it needs:
+
+from traffic_store import TrafficStore
+store = TrafficStore("sqlite:///md_traffic.db")
+store.load(filename)
+morning_rush = store.select(start="2018-07-25", hours=[6, 7, 8, 9],
+                            weekdays=[0, 1, 2, 3, 4])
+print(store.counts("subagency", start="2018-07-25"))
+near_here = store.near(39.0836, -77.1483, 500, violation_types="Citation")
+
+#When a newer md_traffic.json is downloaded, there's no need to load it all
+#again. The store remembers how recent the newest row it has is, and ingest()
+#only adds (or updates) the rows changed since then. ingest_api() gets just
+#those rows from the county's Socrata API instead of a whole new export:
+
+store.ingest(filename)
+store.ingest_api()
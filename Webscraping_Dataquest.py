@@ -379,4 +379,49 @@ print(seahawks_total_yards_count)
 #every single NFL game over an entire season.
 #We could do this manually, but it would take days of boring drudgery.
 #We could write a script to automate this in a couple of hours instead,
-#and have a lot more fun doing it.
\ No newline at end of file
+#and have a lot more fun doing it.
+
+#12. WHOLE TABLES AS DATAFRAMES
+
+#Pulling out one td at a time gets tedious once we want every statistic, and it
+#leaves us with strings like "396" instead of numbers. The scrape_tables module
+#turns a whole table into a DataFrame with typed columns, so we can go straight
+#to pandas. The same builder can be fed table after table from many pages; it
+#converts rows in chunks instead of keeping every cell around as a string.
+
+from scrape_tables import table_to_frame
+
+box_score = table_to_frame(parser.select("table")[0])
+print(box_score)
+print(box_score.dtypes)
+
+#To collect a whole season we'd create one builder and keep calling add_table
+#for each game's page, then grab the combined frame at the end:
+
+#from scrape_tables import TableFrameBuilder
+#season = TableFrameBuilder(chunk_size=5000)
+#for url in game_urls:
+    #page = BeautifulSoup(requests.get(url).content, 'html.parser')
+    #season.add_table(page.select("table")[0])
+#season_stats = season.frame()
+
+#On a crawl of hundreds of pages, parsing with BeautifulSoup ends up being the
+#slow part, and threads don't help because parsing holds the GIL. The
+#scrape_pipeline module downloads pages with threads and parses them in
+#separate processes, and reports how long each stage took:
+
+#from scrape_pipeline import crawl, PipelineStats
+#stats = PipelineStats()
+#for page in crawl(game_urls, extract_box_score, stats=stats):
+    #print(page.url, page.result)
+#print(stats.report())
+
+#Both of those fetch pages with scrape_fetch.fetch_page instead of
+#response.content. It asks for a gzip or brotli compressed page, decompresses
+#it as it streams in, refuses pages over a size limit, and can stop downloading
+#once the elements we're after have arrived:
+
+#from scrape_fetch import fetch_page
+#page = fetch_page("http://dataquestio.github.io/web-scraping-pages/2014_super_bowl.html",
+                  #selectors=["#turnovers", "#total-plays", "#total-yards"])
+#parser = BeautifulSoup(page.content, 'html.parser')
@@ -0,0 +1,176 @@
+import collections
+import threading
+import time
+
+import api_http
+import json_codec
+
+#Caching API responses
+
+#TTLCache is a small least-recently-used cache where every entry also expires
+#after ttl seconds. When it's full, the entry we looked at the longest time ago
+#is dropped to make room. It's safe to share between threads.
+
+#CoalescingCache builds on it for data that rarely changes but gets asked for
+#a lot, like astros.json, which Beginning_with_APIs.py and
+#Dataquest_API_tutorial.py both fetch and which only changes when a crew
+#launches or lands:
+
+#- Single flight: if several callers ask for the same key while it isn't
+#  cached, only the first one calls upstream. The rest wait for that call and
+#  get the same answer (or the same exception).
+#- Stale while revalidate: for stale_ttl seconds after an entry expires we
+#  keep handing out the old value immediately, while one background thread
+#  fetches a fresh copy.
+
+#get_json(url) is the shared entry point the scripts use: a GET through
+#api_http (one shared requests.Session, hedged if that's turned on), decoded
+#as JSON and cached in a module-level CoalescingCache. The decoded object is
+#shared between callers, so treat it as read-only.
+
+_MISSING = object()
+
+
+class TTLCache(object):
+
+    def __init__(self, maxsize=10000, ttl=3600, clock=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= self.clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    #ttl can be overridden per entry, e.g. when the data says when it expires.
+    def set(self, key, value, ttl=None):
+        expires = self.clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class _Flight(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class CoalescingCache(object):
+
+    #fetch     - function(key) that gets the real value.
+    #ttl       - seconds an entry counts as fresh.
+    #stale_ttl - seconds after that an entry may still be served while it is
+    #            refreshed in the background.
+    def __init__(self, fetch, ttl=3600, stale_ttl=24 * 60 * 60, maxsize=1000,
+                 clock=time.time):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.clock = clock
+        self.hits = 0
+        self.stale_hits = 0
+        #Lookups that had to wait for upstream. Unlike upstream_calls, this
+        #leaves out the background refreshes behind stale hits.
+        self.misses = 0
+        self.coalesced = 0
+        self.upstream_calls = 0
+        self._entries = TTLCache(maxsize, ttl + stale_ttl, clock)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _run(self, key, flight):
+        try:
+            self.upstream_calls += 1
+            flight.value = self.fetch(key)
+            self._entries.set(key, (flight.value, self.clock()))
+        except Exception as error:
+            flight.error = error
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            flight.done.set()
+
+    #Join the fetch already running for key, or start one. With background
+    #set, a new fetch runs on its own thread and we don't wait for it.
+    def _flight(self, key, background=False):
+        with self._lock:
+            flight = self._in_flight.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return flight
+            flight = _Flight()
+            self._in_flight[key] = flight
+        if background:
+            thread = threading.Thread(target=self._run, args=(key, flight))
+            thread.daemon = True
+            thread.start()
+        else:
+            self._run(key, flight)
+        return flight
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, fetched_at = entry
+            if self.clock() - fetched_at < self.ttl:
+                self.hits += 1
+                return value
+            self.stale_hits += 1
+            self._flight(key, background=True)
+            return value
+        self.misses += 1
+        return self._flight(key).wait()
+
+    def invalidate(self, key):
+        self._entries.delete(key)
+
+
+def _fetch_json(key):
+    url, params = key
+    response = api_http.get(url, params=dict(params) or None, timeout=30)
+    response.raise_for_status()
+    return json_codec.decode_response(response)
+
+
+shared_cache = CoalescingCache(_fetch_json)
+
+
+def get_json(url, params=None):
+    return shared_cache.get((url, tuple(sorted((params or {}).items()))))
@@ -0,0 +1,183 @@
+import collections
+import concurrent.futures
+import os
+import threading
+import time
+
+import requests
+
+#One HTTP layer for the API clients, with optional hedged GETs
+
+#Public endpoints like open-notify and Datamuse answer most requests quickly,
+#but now and then one takes many times longer, and that slow tail is what we
+#end up waiting on. A hedged GET fights the tail: if the first request hasn't
+#answered by the time 95% of requests to that endpoint normally have, we send
+#the same request again and use whichever answer comes back first. The slow
+#one is usually just unlucky, so the second try is usually fast.
+
+#Only GETs are hedged, since sending one twice must be harmless. Because every
+#hedge is an extra request, HedgedGetter caps them at max_extra of the
+#requests it has sent (10% by default), and doesn't hedge an endpoint at all
+#until it has seen min_samples answers from it to work out its p95.
+
+#get(url, ...) goes through the module-level `getter`, which shares one
+#requests.Session (`session`) between everything that uses it. Hedging is off
+#unless the API_HEDGING environment variable is set to 1 or enable_hedging()
+#is called; get(..., hedge=True/False) overrides that for one call.
+
+#Our own retry loops (the SMS sends, the bot's write actions, stream
+#reconnects) call note_retry(url, reason) each time they try again. That does
+#nothing unless something has been added to retry_hooks, which is how
+#api_metrics.start() counts them without the clients importing it.
+
+
+class LatencyWindow(object):
+
+    #The last `size` latencies seen for one endpoint.
+    def __init__(self, size=200):
+        self._latencies = collections.deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._latencies)
+
+    def add(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def percentile(self, q):
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+
+#Requests to the same scheme, host and path share latency statistics;
+#different query strings don't matter.
+def endpoint_key(url):
+    return url.split("?", 1)[0]
+
+
+class HedgedGetter(object):
+
+    def __init__(self, session=None, enabled=False, quantile=0.95,
+                 max_extra=0.1, min_samples=20, min_delay=0.01, window=200,
+                 workers=16, clock=time.monotonic):
+        self.session = session or requests.Session()
+        self.enabled = enabled
+        self.quantile = quantile
+        self.max_extra = max_extra
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.window = window
+        self.clock = clock
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._windows = {}
+        self._lock = threading.Lock()
+        self._pool = concurrent.futures.ThreadPoolExecutor(workers)
+
+    def latencies(self, url):
+        key = endpoint_key(url)
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None:
+                window = self._windows[key] = LatencyWindow(self.window)
+        return window
+
+    #How long to wait for the first request before hedging, or None if we
+    #shouldn't hedge this one.
+    def hedge_delay(self, url):
+        window = self.latencies(url)
+        if len(window) < self.min_samples:
+            return None
+        return max(window.percentile(self.quantile), self.min_delay)
+
+    def _take_hedge(self):
+        with self._lock:
+            if self.hedges + 1 > self.max_extra * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def _attempt(self, url, kwargs):
+        started = self.clock()
+        response = self.session.get(url, **kwargs)
+        self.latencies(url).add(self.clock() - started)
+        return response
+
+    def get(self, url, params=None, hedge=None, **kwargs):
+        with self._lock:
+            self.requests += 1
+        kwargs["params"] = params
+        hedge = self.enabled if hedge is None else hedge
+        delay = self.hedge_delay(url) if hedge else None
+        if delay is None:
+            return self._attempt(url, kwargs)
+
+        first = self._pool.submit(self._attempt, url, kwargs)
+        try:
+            return first.result(timeout=delay)
+        except concurrent.futures.TimeoutError:
+            pass
+        if not self._take_hedge():
+            return first.result()
+        second = self._pool.submit(self._attempt, url, kwargs)
+        pending = set([first, second])
+        error = None
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                if future is second:
+                    with self._lock:
+                        self.hedge_wins += 1
+                #Nothing else will read the loser's body, so give its
+                #connection back to the pool when it finishes.
+                for loser in pending:
+                    loser.add_done_callback(_close_response)
+                return future.result()
+        raise error
+
+    #Fraction of requests that got a hedge, and of those hedges how many
+    #answered first.
+    def stats(self):
+        return {"requests": self.requests, "hedges": self.hedges,
+                "extra_load": self.hedges / float(self.requests or 1),
+                "hedge_wins": self.hedge_wins}
+
+
+def _close_response(future):
+    if future.exception() is None:
+        future.result().close()
+
+
+session = requests.Session()
+
+getter = HedgedGetter(session,
+                      enabled=os.environ.get("API_HEDGING", "") == "1")
+
+
+retry_hooks = []
+
+
+def note_retry(url, reason="error"):
+    for hook in list(retry_hooks):
+        hook(url, reason)
+
+
+def enable_hedging(enabled=True, **settings):
+    getter.enabled = enabled
+    for name, value in settings.items():
+        if not hasattr(getter, name):
+            raise TypeError("unknown hedging setting %s" % name)
+        setattr(getter, name, value)
+
+
+def get(url, params=None, hedge=None, **kwargs):
+    return getter.get(url, params=params, hedge=hedge, **kwargs)
@@ -0,0 +1,284 @@
+import re
+import threading
+import time
+
+import requests
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from prometheus_client.core import (REGISTRY, CounterMetricFamily,
+                                    GaugeMetricFamily)
+
+#Metrics for every API call
+
+#The scripts only ever print(response.status_code), which tells us nothing
+#about where the time goes. api_metrics records, per endpoint, every outbound
+#request made through an instrumented requests.Session:
+
+#api_request_seconds          - latency histogram, by endpoint, method and
+#                               status (status is "error" if no response came
+#                               back at all)
+#api_request_bytes_total      - bytes in and out, by endpoint and direction
+#api_retries_total            - retries, by endpoint and reason. urllib3
+#                               retries are counted automatically (a plain
+#                               Session makes none); our own retry loops
+#                               call record_retry(): the SMS sends
+#                               ("send_error"), the bot's write actions
+#                               ("api_error") and stream reconnects
+#                               ("reconnect").
+#api_rate_limit_remaining     - the x-rate-limit-remaining (Twitter) /
+#api_rate_limit_limit           X-RateLimit-Remaining (GitHub) headers of the
+#                               latest response from each endpoint
+
+#plus, for anything registered with track_cache(), track_hedging() or
+#track_rate_limits():
+
+#api_cache_requests_total     - lookups by cache and result (hit, stale, miss)
+#api_cache_hit_ratio          - hits (fresh or stale) / lookups, by cache
+#api_hedges_total             - hedged GETs sent, and how many answered first
+#twitter_rate_limit_remaining - what a RateLimitTracker thinks is left
+
+#Call start() once to serve everything on http://127.0.0.1:8000/metrics. By
+#default it calls instrument_requests(), which hooks requests.Session.send
+#itself, so every call made with requests is recorded: plain requests.get()
+#in the tutorial scripts, the api_http session behind get_json, tweepy's
+#calls, crawl(), StreamIngestor, FeedClient and the rest. It also tracks
+#api_cache.shared_cache and the api_http hedging. To record only some
+#clients, pass start(everything=False) and hand their sessions to
+#instrument_session() instead.
+
+#Retries from our own loops reach api_retries_total through
+#api_http.note_retry(), once start() has added record_retry to
+#api_http.retry_hooks.
+
+#The other caches belong to the objects that made them, so start() can't find
+#them by itself. Pass the ones you want as caches={name: cache}, or call
+#track_cache() later: FeedClient.cache, PassPredictionCache.cache and
+#UserHydrator.cache are all TTLCaches.
+
+#Endpoint labels are the host plus the path, with ids, numbers and usernames
+#squashed so that every user or video doesn't become its own time series:
+#api.github.com/users/anesta95 -> api.github.com/users/:id
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+                   30.0)
+
+REQUEST_SECONDS = Histogram(
+    "api_request_seconds", "Time to a complete response (to the headers for "
+    "streamed responses)", ["endpoint", "method", "status"],
+    buckets=LATENCY_BUCKETS)
+REQUEST_BYTES = Counter(
+    "api_request_bytes_total", "Body bytes sent and received",
+    ["endpoint", "direction"])
+RETRIES = Counter(
+    "api_retries_total", "Requests sent again after a failure",
+    ["endpoint", "reason"])
+RATE_LIMIT_REMAINING = Gauge(
+    "api_rate_limit_remaining", "Calls left in the current rate limit window",
+    ["endpoint"])
+RATE_LIMIT_LIMIT = Gauge(
+    "api_rate_limit_limit", "Calls allowed per rate limit window",
+    ["endpoint"])
+
+#Path segments that are one particular thing rather than part of the API.
+#GitHub puts a username after /users/ and an owner and repo after /repos/.
+#Only per host: on Twitter /users/ is followed by the method (lookup.json,
+#show.json), and each of those has its own rate limit.
+_ID_SEGMENT = re.compile(r"^(\d+|[0-9a-f]{8,}|[\w-]*\d[\w-]*)$", re.I)
+_NAMES_AFTER = {
+    "api.github.com": {"users": 1, "orgs": 1, "repos": 2},
+    "gdata.youtube.com": {"videos": 1},
+}
+_EXTENSION = re.compile(r"\.(json|xml|html?)$")
+
+
+def endpoint_label(url):
+    url = url.split("?", 1)[0].split("#", 1)[0]
+    host, _, path = url.partition("://")[2].partition("/")
+    names_after = _NAMES_AFTER.get(host, {})
+    segments = []
+    names = 0
+    for segment in path.split("/"):
+        if not segment:
+            continue
+        if names or _ID_SEGMENT.match(_EXTENSION.sub("", segment)):
+            names = max(names - 1, 0)
+            segments.append(":id")
+        else:
+            names = names_after.get(segment, 0)
+            segments.append(segment)
+    return "/".join([host] + segments[:4])
+
+
+_HEADER_NAMES = (("x-rate-limit-remaining", "x-rate-limit-limit"),
+                 ("x-ratelimit-remaining", "x-ratelimit-limit"))
+
+
+def _observe(endpoint, request, response, seconds, stream):
+    REQUEST_SECONDS.labels(endpoint, request.method,
+                           str(response.status_code)).observe(seconds)
+    sent = request.body
+    if sent:
+        REQUEST_BYTES.labels(endpoint, "out").inc(
+            len(sent) if isinstance(sent, (bytes, str)) else 0)
+    if not stream:
+        received = len(response.content)
+    else:
+        #We can't count a streamed body without reading it ourselves, so go
+        #by what the server said it would send.
+        received = int(response.headers.get("Content-Length") or 0)
+    REQUEST_BYTES.labels(endpoint, "in").inc(received)
+    retries = getattr(getattr(response.raw, "retries", None), "history", ())
+    if retries:
+        RETRIES.labels(endpoint, "urllib3").inc(len(retries))
+    headers = response.headers
+    for remaining, limit in _HEADER_NAMES:
+        if remaining in headers:
+            RATE_LIMIT_REMAINING.labels(endpoint).set(
+                float(headers[remaining]))
+            if limit in headers:
+                RATE_LIMIT_LIMIT.labels(endpoint).set(float(headers[limit]))
+            break
+
+
+def _send(send, endpoint, request, kwargs):
+    label = endpoint(request.url)
+    started = time.monotonic()
+    try:
+        response = send(request, **kwargs)
+    except Exception:
+        REQUEST_SECONDS.labels(label, request.method, "error").observe(
+            time.monotonic() - started)
+        raise
+    _observe(label, request, response, time.monotonic() - started,
+             kwargs.get("stream", False))
+    return response
+
+
+#Record every request the session sends. Safe to call more than once on the
+#same session, or after instrument_requests(). endpoint turns a URL into its
+#label.
+def instrument_session(session, endpoint=endpoint_label):
+    if getattr(session, "_api_metrics", False):
+        return session
+    send = session.send
+    session.send = lambda request, **kwargs: _send(send, endpoint, request,
+                                                   kwargs)
+    session._api_metrics = True
+    return session
+
+
+#Record every request made with requests, from any session.
+def instrument_requests(endpoint=endpoint_label):
+    if getattr(requests.Session, "_api_metrics", False):
+        return
+    send = requests.Session.send
+
+    def instrumented_send(self, request, **kwargs):
+        return _send(lambda request, **kwargs: send(self, request, **kwargs),
+                     endpoint, request, kwargs)
+
+    requests.Session.send = instrumented_send
+    requests.Session._api_metrics = True
+
+
+#tweepy 4 keeps its requests.Session in api.session. tweepy 3 made a new
+#session per call, so there's nothing to hook; returns False then.
+def instrument_tweepy(api):
+    session = getattr(api, "session", None)
+    if session is None or not hasattr(session, "send"):
+        return False
+    instrument_session(session)
+    return True
+
+
+#url is the URL that was retried, or an endpoint label as it is.
+def record_retry(url, reason="error"):
+    label = endpoint_label(url) if "://" in url else url
+    RETRIES.labels(label, reason).inc()
+
+
+class _Collector(object):
+
+    def __init__(self):
+        self.caches = {}
+        self.getters = {}
+        self.trackers = {}
+        self._lock = threading.Lock()
+
+    def collect(self):
+        with self._lock:
+            caches = list(self.caches.items())
+            getters = list(self.getters.items())
+            trackers = list(self.trackers.items())
+        lookups = CounterMetricFamily(
+            "api_cache_requests", "Cache lookups by result",
+            labels=["cache", "result"])
+        ratio = GaugeMetricFamily(
+            "api_cache_hit_ratio", "Share of lookups answered from the cache",
+            labels=["cache"])
+        for name, cache in caches:
+            counts = {"hit": cache.hits,
+                      "stale": getattr(cache, "stale_hits", 0),
+                      "miss": cache.misses}
+            for result, count in counts.items():
+                lookups.add_metric([name, result], count)
+            total = sum(counts.values())
+            ratio.add_metric([name], (counts["hit"] + counts["stale"]) /
+                             float(total) if total else 0.0)
+        yield lookups
+        yield ratio
+
+        hedges = CounterMetricFamily(
+            "api_hedges", "Hedged GETs sent, and hedges that answered first",
+            labels=["getter", "outcome"])
+        for name, getter in getters:
+            hedges.add_metric([name, "sent"], getter.hedges)
+            hedges.add_metric([name, "won"], getter.hedge_wins)
+        yield hedges
+
+        remaining = GaugeMetricFamily(
+            "twitter_rate_limit_remaining",
+            "Calls left per Twitter endpoint, as tracked locally",
+            labels=["tracker", "endpoint"])
+        for name, tracker in trackers:
+            for endpoint, budget in tracker.budgets().items():
+                remaining.add_metric([name, endpoint], budget.remaining)
+        yield remaining
+
+
+_collector = _Collector()
+REGISTRY.register(_collector)
+
+
+#Any cache with hits and misses counters (TTLCache), plus stale_hits
+#(CoalescingCache).
+def track_cache(name, cache):
+    with _collector._lock:
+        _collector.caches[name] = cache
+
+
+def track_hedging(name, getter):
+    with _collector._lock:
+        _collector.getters[name] = getter
+
+
+def track_rate_limits(name, tracker):
+    with _collector._lock:
+        _collector.trackers[name] = tracker
+
+
+#Serve /metrics and hook up the shared HTTP layer. caches is an optional
+#{name: cache} of more caches to track, e.g. {"youtube_feed": feed.cache}.
+def start(port=8000, addr="127.0.0.1", everything=True, caches=None):
+    import api_cache
+    import api_http
+    if everything:
+        instrument_requests()
+    else:
+        instrument_session(api_http.session)
+    track_cache("get_json", api_cache.shared_cache)
+    if record_retry not in api_http.retry_hooks:
+        api_http.retry_hooks.append(record_retry)
+    for name, cache in (caches or {}).items():
+        track_cache(name, cache)
+    track_hedging("api_http", api_http.getter)
+    start_http_server(port, addr)
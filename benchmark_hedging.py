@@ -0,0 +1,102 @@
+import argparse
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from api_http import HedgedGetter
+
+#Benchmark for hedged GETs
+
+#Starts a local server that answers like a flaky public API: most requests
+#take around --fast seconds, but a --slow-fraction of them take --slow
+#seconds. Every request draws its own latency, the way a real slow request
+#is usually bad luck on one connection or backend, not the URL itself.
+
+#The same sequence of GETs is then run without hedging and with it, and we
+#print the latency percentiles for both along with the extra load the hedges
+#added. Hedging only helps while the slow requests are rarer than 1 -
+#quantile (5% by default); when more than that are slow, the p95 itself is
+#slow and there's nothing to hedge against.
+
+#python benchmark_hedging.py
+#python benchmark_hedging.py --requests 2000 --slow-fraction 0.01 --slow 1.0
+
+
+def latency_server(fast=0.02, slow=0.5, slow_fraction=0.02, seed=0,
+                   port=0):
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    body = b'{"message": "success", "number": 7}'
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            with lock:
+                delay = slow if rng.random() < slow_fraction else \
+                    rng.uniform(fast * 0.5, fast * 1.5)
+            time.sleep(delay)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def percentile(latencies, q):
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+
+def run(url, requests_, hedge, max_extra=0.1):
+    getter = HedgedGetter(requests.Session(), enabled=hedge,
+                          max_extra=max_extra)
+    latencies = []
+    for _ in range(requests_):
+        started = time.monotonic()
+        getter.get(url, timeout=30).content
+        latencies.append(time.monotonic() - started)
+    return latencies, getter.stats()
+
+
+def report(name, latencies, stats):
+    print("%-10s p50 %7.1f ms  p95 %7.1f ms  p99 %7.1f ms  max %7.1f ms  "
+          "extra load %5.1f%%  hedge wins %d" % (
+              name, percentile(latencies, 0.5) * 1e3,
+              percentile(latencies, 0.95) * 1e3,
+              percentile(latencies, 0.99) * 1e3, max(latencies) * 1e3,
+              stats["extra_load"] * 100, stats["hedge_wins"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare tail latency with and without hedged GETs.")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--fast", type=float, default=0.02)
+    parser.add_argument("--slow", type=float, default=0.5)
+    parser.add_argument("--slow-fraction", type=float, default=0.02)
+    parser.add_argument("--max-extra", type=float, default=0.1)
+    args = parser.parse_args()
+    server = latency_server(args.fast, args.slow, args.slow_fraction)
+    url = "http://127.0.0.1:%d/astros.json" % server.server_address[1]
+    try:
+        report("plain", *run(url, args.requests, False))
+        report("hedged", *run(url, args.requests, True, args.max_extra))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
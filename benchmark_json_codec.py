@@ -0,0 +1,127 @@
+import argparse
+import json
+import random
+import timeit
+
+import json_codec
+
+#Benchmark for the json_codec backends
+
+#Times decoding (from bytes, the way the HTTP clients now call it) and
+#encoding for every installed backend on payloads shaped like the ones our
+#scripts actually get back: astros.json, iss-now.json, iss-pass.json, a
+#Datamuse word list, a GitHub user, a page of the YouTube feed and a chunk of
+#the md_traffic.json rows.
+
+#Run it with:
+
+#python benchmark_json_codec.py
+#python benchmark_json_codec.py --repeat 5 --traffic-rows 50000
+
+#Pass a file of recorded responses (one JSON document per line) with
+#--payloads to benchmark real captured data instead of the built-in samples.
+
+
+def sample_payloads(traffic_rows=20000, seed=0):
+    rng = random.Random(seed)
+    astros = {"message": "success", "number": 7, "people": [
+        {"craft": "ISS", "name": "Astronaut %d" % i} for i in range(7)]}
+    iss_now = {"message": "success", "timestamp": 1547000000,
+               "iss_position": {"latitude": "-19.7829",
+                                "longitude": "116.4376"}}
+    iss_pass = {"message": "success",
+                "request": {"altitude": 100, "datetime": 1547000000,
+                            "latitude": 40.71, "longitude": -74.0,
+                            "passes": 5},
+                "response": [{"duration": rng.randint(300, 650),
+                              "risetime": 1547000000 + i * 5400}
+                             for i in range(5)]}
+    datamuse = [{"word": "word%d" % i, "score": rng.randint(1, 5000),
+                 "numSyllables": rng.randint(1, 4)} for i in range(100)]
+    github_user = dict(("field_%d" % i, "value %d" % i) for i in range(30))
+    github_user.update({"login": "anesta95", "id": 123456, "bio": None,
+                        "public_repos": 42, "site_admin": False})
+    youtube = {"apiVersion": "2.1", "data": {
+        "totalItems": 1000, "startIndex": 1, "itemsPerPage": 25,
+        "items": [{"id": "vid%08d" % i, "title": "Video %d" % i,
+                   "category": "Music", "rating": rng.uniform(1, 5),
+                   "player": {"default": "https://youtube.com/v/%d" % i},
+                   "description": "x" * rng.randint(50, 400),
+                   "viewCount": rng.randint(0, 10 ** 7)}
+                  for i in range(25)]}}
+    colors = ["BLACK", "SILVER", "WHITE", "GRAY", "RED", "BLUE"]
+    traffic = {"data": [
+        [i, "0000-%d" % i, i, 1400000000, "", 1400000000, "", "{}",
+         "2013-09-24T00:00:00", "17:11:00", "MCP",
+         "3rd district, Silver Spring",
+         "DRIVING VEHICLE ON HIGHWAY WITH SUSPENDED REGISTRATION",
+         "8804 FLOWER AVE", "%.7f" % rng.uniform(38.9, 39.3),
+         "%.7f" % rng.uniform(-77.3, -76.9), "No", "No", "No", "No",
+         "02 - Automobile", "2008", "FORD", "4S", rng.choice(colors),
+         "Citation", "13-401(h)", "Transportation Article", "No", "BLACK",
+         "M", "TAKOMA PARK", "MD", "MD", "A - Marked Patrol"]
+        for i in range(traffic_rows)]}
+    return [("astros.json", astros), ("iss-now.json", iss_now),
+            ("iss-pass.json", iss_pass), ("datamuse words", datamuse),
+            ("github user", github_user), ("youtube feed", youtube),
+            ("md_traffic rows", traffic)]
+
+
+def _load_payloads(path):
+    payloads = []
+    with open(path, "rb") as f:
+        for number, line in enumerate(f, 1):
+            if line.strip():
+                payloads.append(("%s:%d" % (path, number), json.loads(line)))
+    return payloads
+
+
+#Best of `repeat` runs, in seconds per call.
+def _time(function, argument, repeat):
+    timer = timeit.Timer(lambda: function(argument))
+    calls, _ = timer.autorange()
+    return min(timer.repeat(repeat, calls)) / calls
+
+
+def run(payloads, repeat=3):
+    results = []
+    for name, payload in payloads:
+        encoded = json.dumps(payload).encode("utf-8")
+        for backend, (loads, dumps) in sorted(json_codec.BACKENDS.items()):
+            decode = _time(loads, encoded, repeat)
+            encode = _time(dumps, payload, repeat)
+            results.append((name, backend, len(encoded), decode, encode))
+    return results
+
+
+def report(results):
+    print("%-18s %-7s %10s %12s %10s %12s %10s" % (
+        "payload", "backend", "bytes", "decode us", "MB/s", "encode us",
+        "vs json"))
+    baseline = dict(((name, "decode"), decode)
+                    for name, backend, size, decode, encode in results
+                    if backend == "json")
+    for name, backend, size, decode, encode in results:
+        print("%-18s %-7s %10d %12.1f %10.1f %12.1f %9.2fx" % (
+            name, backend, size, decode * 1e6, size / decode / 1e6,
+            encode * 1e6, baseline[(name, "decode")] / decode))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare JSON backends on API-shaped payloads.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--traffic-rows", type=int, default=20000)
+    parser.add_argument("--payloads",
+                        help="file of recorded JSON responses, one per line")
+    args = parser.parse_args()
+    if args.payloads:
+        payloads = _load_payloads(args.payloads)
+    else:
+        payloads = sample_payloads(args.traffic_rows)
+    print("default backend: %s" % json_codec.backend)
+    report(run(payloads, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import requests
+import tweepy
+
+from api_cache import TTLCache
+from iss_pass_cache import PassPredictionCache
+from iss_tracker import ISSTracker, PositionStore
+from replay_server import Cassette, ReplayServer, recording, redirect
+from scrape_pipeline import crawl
+from tweepy_streaming import followers, home_timeline
+from youtube_feed import FeedClient
+
+#Offline benchmarks for every workflow
+
+#Runs each of the repo's workflows against a ReplayServer instead of the live
+#APIs, so the numbers only change when our code does:
+
+#github    - the user, starred, org and repo lookups from
+#            Intermediate_APIs_Dataquest.py, with plain requests.get
+#datamuse  - rhyme lookups from Beginning_with_APIs.py
+#iss       - ISSTracker polls and PassPredictionCache lookups
+#scraping  - crawl() over the dataquestio.github.io tutorial pages
+#youtube   - FeedClient paging through the top_rated feed
+#tweepy    - home_timeline and followers paging via tweepy_streaming
+
+#For each one we print how many operations it did, throughput, p50/p95
+#latency per operation and how many requests the server answered.
+
+#By default the responses come from built-in sample payloads shaped like the
+#real ones. To use real data, record a cassette from the live endpoints once
+#and replay it afterwards:
+
+#python benchmark_suite.py --record cassette.jsonl
+#python benchmark_suite.py --cassette cassette.jsonl --latency 0.05 --bandwidth 1000000
+
+#To catch regressions, save the results of one version and compare another
+#against them. The exit status is 1 if any workflow's throughput dropped or
+#p95 grew by more than --tolerance:
+
+#python benchmark_suite.py --save before.json
+#python benchmark_suite.py --baseline before.json --tolerance 0.2
+
+GITHUB_URLS = [
+    "https://api.github.com/users/anesta95",
+    "https://api.github.com/users/anesta95/starred",
+    "https://api.github.com/orgs/dataquestio",
+    "https://api.github.com/repos/octocat/Hello-World",
+]
+DATAMUSE_URL = "https://api.datamuse.com/words"
+ISS_NOW_URL = "http://api.open-notify.org/iss-now.json"
+ISS_PASS_URL = "http://api.open-notify.org/iss-pass.json"
+SCRAPE_URLS = [
+    "http://dataquestio.github.io/web-scraping-pages/simple.html",
+    "http://dataquestio.github.io/web-scraping-pages/simple_classes.html",
+    "http://dataquestio.github.io/web-scraping-pages/simple_ids.html",
+    "http://dataquestio.github.io/web-scraping-pages/ids_and_classes.html",
+    "http://dataquestio.github.io/web-scraping-pages/2014_super_bowl.html",
+]
+YOUTUBE_URL = "http://gdata.youtube.com/feeds/api/standardfeeds/top_rated"
+TWITTER_URL = "https://api.twitter.com/1.1"
+
+
+def _json(value):
+    return json.dumps(value).encode("utf-8")
+
+
+#A cassette of made-up responses for every request the workflows make.
+def sample_cassette(seed=0):
+    rng = random.Random(seed)
+    cassette = Cassette()
+    json_headers = {"Content-Type": "application/json; charset=utf-8"}
+    github_headers = dict(json_headers, **{"X-RateLimit-Limit": "60",
+                                            "X-RateLimit-Remaining": "59"})
+
+    user = dict(("field_%d" % i, "value %d" % i) for i in range(30))
+    user.update({"login": "anesta95", "id": 1, "public_repos": 42})
+    starred = [{"id": i, "name": "repo%d" % i, "full_name": "user/repo%d" % i,
+                "description": "x" * rng.randint(20, 200),
+                "stargazers_count": rng.randint(0, 10000)}
+               for i in range(30)]
+    org = {"login": "dataquestio", "id": 2, "public_repos": 100}
+    repo = {"id": 3, "name": "Hello-World", "full_name": "octocat/Hello-World",
+            "owner": {"login": "octocat"}, "forks": 1000}
+    for url, payload in zip(GITHUB_URLS, [user, starred, org, repo]):
+        cassette.add("GET", url, 200, github_headers, _json(payload))
+
+    cassette.add("GET", DATAMUSE_URL, 200, json_headers, _json(
+        [{"word": "word%d" % i, "score": rng.randint(1, 5000),
+          "numSyllables": rng.randint(1, 4)} for i in range(100)]))
+
+    now = int(time.time())
+    cassette.add("GET", ISS_NOW_URL, 200, json_headers, _json(
+        {"message": "success", "timestamp": now,
+         "iss_position": {"latitude": "-19.7829", "longitude": "116.4376"}}))
+    cassette.add("GET", ISS_PASS_URL, 200, json_headers, _json(
+        {"message": "success",
+         "request": {"altitude": 100, "datetime": now, "passes": 5},
+         "response": [{"duration": rng.randint(300, 650),
+                       "risetime": now + 3600 + i * 5400}
+                      for i in range(5)]}))
+
+    rows = "".join("<tr><td>%d</td><td>Team %d</td><td>%d</td></tr>" % (
+        i, i, rng.randint(0, 50)) for i in range(200))
+    for url in SCRAPE_URLS:
+        page = ("<!DOCTYPE html><html><head><title>A simple example page"
+                "</title></head><body><div><p class='inner-text first-item' "
+                "id='first'>First paragraph.</p><p class='outer-text'>"
+                "Second paragraph.</p></div><table>%s</table></body></html>"
+                % rows)
+        cassette.add("GET", url, 200, {"Content-Type": "text/html"},
+                     page.encode("utf-8"))
+
+    items = [{"id": "vid%08d" % i, "title": "Video %d" % i,
+              "category": "Music", "rating": rng.uniform(1, 5),
+              "player": {"default": "https://youtube.com/v/%d" % i},
+              "description": "x" * rng.randint(50, 400)} for i in range(50)]
+    cassette.add("GET", YOUTUBE_URL, 200, json_headers, _json(
+        {"apiVersion": "2.1", "data": {"totalItems": 500, "startIndex": 1,
+                                       "itemsPerPage": 50, "items": items}}))
+
+    twitter_headers = dict(json_headers, **{"x-rate-limit-limit": "15",
+                                             "x-rate-limit-remaining": "14"})
+    tweets = [{"id": 10 ** 12 - i, "id_str": str(10 ** 12 - i),
+               "text": "tweet %d " % i + "x" * rng.randint(10, 200),
+               "user": {"id": 7, "id_str": "7", "screen_name": "anesta95"}}
+              for i in range(200)]
+    cassette.add("GET", TWITTER_URL + "/statuses/home_timeline.json", 200,
+                 twitter_headers, _json(tweets))
+    users = [{"id": i, "id_str": str(i), "screen_name": "user%d" % i,
+              "followers_count": rng.randint(0, 5000)} for i in range(200)]
+    cassette.add("GET", TWITTER_URL + "/followers/list.json", 200,
+                 twitter_headers, _json({"users": users, "next_cursor": 0,
+                                         "previous_cursor": 0}))
+    return cassette
+
+
+#This runs inside crawl()'s worker processes.
+def page_paragraphs(url, parser):
+    return len(parser.find_all("p")) + len(parser.find_all("tr"))
+
+
+class Timer(object):
+
+    def __init__(self):
+        self.latencies = []
+
+    def time(self, function, *args, **kwargs):
+        started = time.perf_counter()
+        result = function(*args, **kwargs)
+        self.latencies.append(time.perf_counter() - started)
+        return result
+
+
+def _get_json(url, **kwargs):
+    response = requests.get(url, **kwargs)
+    response.raise_for_status()
+    return response.json()
+
+
+def bench_github(timer, iterations):
+    for _ in range(iterations):
+        for url in GITHUB_URLS:
+            timer.time(_get_json, url)
+
+
+def bench_datamuse(timer, iterations):
+    words = ["jingle", "python", "space", "station", "orbit"]
+    for i in range(iterations):
+        timer.time(_get_json, DATAMUSE_URL,
+                   params={"rel_rhy": words[i % len(words)]})
+
+
+def bench_iss(timer, iterations):
+    directory = tempfile.mkdtemp()
+    try:
+        tracker = ISSTracker(PositionStore(os.path.join(directory, "iss")))
+        passes = PassPredictionCache(grid=0.5)
+        rng = random.Random(0)
+        for _ in range(iterations):
+            timer.time(tracker.poll_once)
+            timer.time(passes.passes, rng.uniform(-50, 50),
+                       rng.uniform(-180, 180))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_scraping(timer, iterations):
+    urls = SCRAPE_URLS * iterations
+    started = time.perf_counter()
+    results = list(crawl(urls, page_paragraphs, fetchers=4, parse_workers=2))
+    errors = [result.error for result in results if result.error is not None]
+    if errors:
+        raise errors[0]
+    #crawl() overlaps the pages, so all we can time per page is the average.
+    seconds = (time.perf_counter() - started) / max(len(results), 1)
+    timer.latencies.extend([seconds] * len(results))
+
+
+def bench_youtube(timer, iterations):
+    for _ in range(iterations):
+        #A new client each time, so the page cache doesn't answer for us.
+        client = FeedClient(cache=TTLCache(ttl=0))
+        timer.time(client.videos, "top_rated", limit=200)
+
+
+def _twitter_api():
+    keys = [os.environ.get(name, "replay") for name in (
+        "TWITTER_CONSUMER_KEY", "TWITTER_CONSUMER_SECRET",
+        "TWITTER_ACCESS_TOKEN", "TWITTER_ACCESS_TOKEN_SECRET")]
+    handler = getattr(tweepy, "OAuth1UserHandler", None) or getattr(
+        tweepy, "OAuthHandler")
+    auth = handler(keys[0], keys[1])
+    auth.set_access_token(keys[2], keys[3])
+    return tweepy.API(auth)
+
+
+def bench_tweepy(timer, iterations):
+    api = _twitter_api()
+    for _ in range(iterations):
+        timer.time(lambda: list(home_timeline(api, limit=400)))
+        timer.time(lambda: list(followers(api, "anesta95", limit=200)))
+
+
+WORKFLOWS = [
+    ("github", bench_github),
+    ("datamuse", bench_datamuse),
+    ("iss", bench_iss),
+    ("scraping", bench_scraping),
+    ("youtube", bench_youtube),
+    ("tweepy", bench_tweepy),
+]
+
+
+def percentile(latencies, q):
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+
+def run(names, iterations, server=None):
+    results = {}
+    for name, workflow in WORKFLOWS:
+        if name not in names:
+            continue
+        timer = Timer()
+        served = server.served if server is not None else 0
+        started = time.perf_counter()
+        try:
+            workflow(timer, iterations)
+        except Exception as error:
+            results[name] = {"error": "%s: %s" % (type(error).__name__, error)}
+            continue
+        seconds = time.perf_counter() - started
+        results[name] = {
+            "operations": len(timer.latencies),
+            "seconds": seconds,
+            "throughput": len(timer.latencies) / seconds,
+            "p50": percentile(timer.latencies, 0.5),
+            "p95": percentile(timer.latencies, 0.95),
+            "requests": (server.served - served) if server is not None
+            else None,
+        }
+    return results
+
+
+def report(results):
+    print("%-10s %6s %9s %10s %10s %10s %9s" % (
+        "workflow", "ops", "seconds", "ops/s", "p50 ms", "p95 ms",
+        "requests"))
+    for name, _ in WORKFLOWS:
+        result = results.get(name)
+        if result is None:
+            continue
+        if "error" in result:
+            print("%-10s failed: %s" % (name, result["error"]))
+            continue
+        print("%-10s %6d %9.2f %10.1f %10.1f %10.1f %9s" % (
+            name, result["operations"], result["seconds"],
+            result["throughput"], result["p50"] * 1e3, result["p95"] * 1e3,
+            "-" if result["requests"] is None else result["requests"]))
+
+
+#Workflows whose throughput fell, or p95 rose, by more than tolerance.
+def regressions(results, baseline, tolerance):
+    found = []
+    for name, before in baseline.items():
+        after = results.get(name)
+        if after is None or "error" in before:
+            continue
+        if "error" in after:
+            found.append((name, "failed", after["error"]))
+            continue
+        if after["throughput"] < before["throughput"] * (1 - tolerance):
+            found.append((name, "throughput", "%.1f -> %.1f ops/s" % (
+                before["throughput"], after["throughput"])))
+        if after["p95"] > before["p95"] * (1 + tolerance):
+            found.append((name, "p95", "%.1f -> %.1f ms" % (
+                before["p95"] * 1e3, after["p95"] * 1e3)))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark every workflow against recorded responses.")
+    parser.add_argument("--workflows", nargs="+",
+                        default=[name for name, _ in WORKFLOWS],
+                        choices=[name for name, _ in WORKFLOWS])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="up to this many more seconds, at random")
+    parser.add_argument("--bandwidth", type=float, default=None,
+                        help="bytes per second for response bodies")
+    parser.add_argument("--cassette",
+                        help="recorded responses to replay, on top of the "
+                             "built-in samples")
+    parser.add_argument("--record",
+                        help="run against the live APIs and save what they "
+                             "send to this file")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline",
+                        help="results saved by an earlier --save to compare "
+                             "against")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    if args.record:
+        cassette = Cassette()
+        with recording(cassette):
+            results = run(args.workflows, 1)
+        cassette.save(args.record)
+        report(results)
+        print("recorded %d responses to %s" % (len(cassette), args.record))
+        return 0
+
+    cassette = sample_cassette()
+    if args.cassette:
+        cassette.merge(Cassette.load(args.cassette))
+    server = ReplayServer(cassette, latency=args.latency, jitter=args.jitter,
+                          bandwidth=args.bandwidth, seed=0)
+    with server, redirect(server.url):
+        results = run(args.workflows, args.iterations, server)
+    report(results)
+    if server.misses:
+        print("%d requests had no recording" % server.misses)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for name, what, detail in found:
+            print("REGRESSION %s %s: %s" % (name, what, detail))
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
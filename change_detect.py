@@ -0,0 +1,59 @@
+import hashlib
+import json
+import os
+
+#Only acting when the data actually changed
+
+#The Twilio example texts "the number of people in space right now is N" every
+#time it runs. Run it from cron every minute and that's 1,440 identical texts
+#a day, when the crew changes a few times a year.
+
+#ChangeDetector takes the fields we care about out of a payload (for
+#astros.json, number and people), turns them into a canonical JSON string and
+#hashes it. The hash of the last payload we acted on is kept in a small file.
+#changed() compares against it, and remember() saves the new hash once we've
+#acted, so a failed send is retried on the next run instead of being
+#forgotten.
+
+#Lists of dicts are sorted before hashing, so the API returning the same crew
+#in a different order doesn't count as a change.
+
+
+def _canonical(value):
+    if isinstance(value, dict):
+        return dict((key, _canonical(item)) for key, item in value.items())
+    if isinstance(value, list):
+        items = [_canonical(item) for item in value]
+        return sorted(items, key=lambda item: json.dumps(item, sort_keys=True))
+    return value
+
+
+class ChangeDetector(object):
+
+    #fields - top level keys to compare; None compares the whole payload.
+    def __init__(self, state_path, fields=None):
+        self.state_path = state_path
+        self.fields = list(fields) if fields is not None else None
+
+    def fingerprint(self, payload):
+        if self.fields is not None:
+            payload = dict((field, payload.get(field))
+                           for field in self.fields)
+        text = json.dumps(_canonical(payload), sort_keys=True,
+                          separators=(",", ":"))
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def last_fingerprint(self):
+        if not os.path.exists(self.state_path):
+            return None
+        with open(self.state_path) as f:
+            return f.read().strip() or None
+
+    def changed(self, payload):
+        return self.fingerprint(payload) != self.last_fingerprint()
+
+    def remember(self, payload):
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(self.fingerprint(payload))
+        os.replace(tmp, self.state_path)
@@ -0,0 +1,97 @@
+import math
+import time
+
+import requests
+
+import json_codec
+from api_cache import TTLCache
+
+#Sharing ISS pass predictions between nearby locations
+
+#The tutorial asks iss-pass.json when the ISS will pass over New York
+#({"lat": 40.71, "lon": -74}) and San Francisco ({"lat": 37.78,
+#"lon": -122.41}). If thousands of users each ask about their own location,
+#that's thousands of requests, yet people a few kilometres apart see the
+#station rise within seconds of each other.
+
+#PassPredictionCache snaps every location onto a grid (half a degree by
+#default, roughly 50 km) and asks open-notify about the middle of the grid
+#cell. Everyone in the same cell is served from that one response.
+
+#A prediction is good until its first pass has happened, so each entry
+#expires at the earliest risetime in the payload instead of after a fixed
+#time. Passes that are already over are filtered out when serving from cache.
+
+ISS_PASS_URL = "http://api.open-notify.org/iss-pass.json"
+
+
+class PassPredictionCache(object):
+
+    #grid      - cell size in degrees.
+    #max_ttl   - upper bound on how long any entry is kept, in seconds.
+    #min_ttl   - entries whose first pass is imminent are still kept this
+    #            long, so a burst of requests doesn't all go upstream.
+    def __init__(self, grid=0.5, url=ISS_PASS_URL, session=None, cache=None,
+                 max_ttl=24 * 60 * 60, min_ttl=60, timeout=10,
+                 clock=time.time):
+        self.grid = grid
+        self.url = url
+        self.session = session or requests.Session()
+        self.clock = clock
+        self.cache = cache if cache is not None else TTLCache(
+            maxsize=50000, ttl=max_ttl, clock=clock)
+        self.max_ttl = max_ttl
+        self.min_ttl = min_ttl
+        self.timeout = timeout
+        self.upstream_calls = 0
+
+    #Centre of the grid cell a location falls in. Every location in the cell
+    #maps to exactly the same coordinates, which is what makes them share a
+    #cache entry.
+    def cell(self, lat, lon):
+        def snap(value):
+            return round((math.floor(value / self.grid) + 0.5) * self.grid, 6)
+        lat = min(max(snap(lat), -90.0), 90.0)
+        lon = snap(((lon + 180.0) % 360.0) - 180.0)
+        return lat, lon
+
+    def _ttl(self, payload):
+        risetimes = [p["risetime"] for p in payload.get("response", [])
+                     if "risetime" in p]
+        if not risetimes:
+            return self.min_ttl
+        ttl = min(risetimes) - self.clock()
+        return min(max(ttl, self.min_ttl), self.max_ttl)
+
+    def _fetch(self, lat, lon, n, alt):
+        params = {"lat": lat, "lon": lon}
+        if n is not None:
+            params["n"] = n
+        if alt is not None:
+            params["alt"] = alt
+        self.upstream_calls += 1
+        response = self.session.get(self.url, params=params,
+                                    timeout=self.timeout)
+        response.raise_for_status()
+        return json_codec.decode_response(response)
+
+    #Same payload shape as iss-pass.json, with only the passes that haven't
+    #happened yet.
+    def passes(self, lat, lon, n=None, alt=None):
+        cell_lat, cell_lon = self.cell(lat, lon)
+        key = (cell_lat, cell_lon, n, alt)
+        payload = self.cache.get(key)
+        if payload is None:
+            payload = self._fetch(cell_lat, cell_lon, n, alt)
+            self.cache.set(key, payload, ttl=self._ttl(payload))
+        now = self.clock()
+        upcoming = [p for p in payload.get("response", [])
+                    if p.get("risetime", now) + p.get("duration", 0) >= now]
+        result = dict(payload)
+        result["response"] = upcoming
+        return result
+
+    @property
+    def hit_ratio(self):
+        total = self.cache.hits + self.cache.misses
+        return self.cache.hits / float(total) if total else 0.0
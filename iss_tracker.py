@@ -0,0 +1,203 @@
+import os
+import time
+
+import numpy as np
+import requests
+
+import json_codec
+
+#Tracking the ISS over time
+
+#Dataquest_API_tutorial.py asks iss-now.json where the space station is once
+#and prints the answer. To follow it around we poll that endpoint on a fixed
+#schedule and keep every position we get back.
+
+#A position is a timestamp plus a latitude and longitude, which iss-now gives
+#to 4 decimal places. Stored naively as three float64 numbers that's 24 bytes
+#a reading. Consecutive readings are only a few seconds and a fraction of a
+#degree apart though, so PositionStore keeps the *difference* from the
+#previous reading instead, as three int16 numbers (seconds, and latitude and
+#longitude in 1/10000ths of a degree): 6 bytes a reading.
+
+#Readings are grouped into blocks. Each block keeps its first reading in full
+#in a small index, along with its last timestamp, so to answer "where was the
+#ISS between t1 and t2" we look at the index, read only the blocks that
+#overlap that window and add the differences back up with np.cumsum. Both the
+#blocks and the index are memory-mapped files, so history survives restarts
+#and is never loaded into memory all at once.
+
+#There's a fixed number of blocks. Once they're all full, the oldest block is
+#reused, which makes the store a ring buffer of the most recent history.
+
+ISS_NOW_URL = "http://api.open-notify.org/iss-now.json"
+
+SCALE = 10000
+_INT16 = np.iinfo(np.int16)
+_FULL_CIRCLE = 360 * SCALE
+
+#Columns of the block index.
+SEQ, COUNT, BASE_TS, BASE_LAT, BASE_LON, END_TS, END_LAT, END_LON = range(8)
+
+POSITION_DTYPE = np.dtype([("timestamp", np.int64),
+                           ("latitude", np.float64),
+                           ("longitude", np.float64)])
+
+
+#Longitude wraps around at +/-180, so a step from 179.9 to -179.9 is really
+#0.2 degrees, not -359.8.
+def _wrap(units):
+    return (units + _FULL_CIRCLE // 2) % _FULL_CIRCLE - _FULL_CIRCLE // 2
+
+
+class PositionStore(object):
+
+    def __init__(self, path, blocks=1024, block_size=4096):
+        os.makedirs(path, exist_ok=True)
+        data_path = os.path.join(path, "positions.i16")
+        index_path = os.path.join(path, "blocks.i64")
+        exists = os.path.exists(data_path) and os.path.exists(index_path)
+        mode = "r+" if exists else "w+"
+        self.blocks = blocks
+        self.block_size = block_size
+        self._data = np.memmap(data_path, dtype=np.int16, mode=mode,
+                               shape=(blocks, block_size, 3))
+        self._index = np.memmap(index_path, dtype=np.int64, mode=mode,
+                                shape=(blocks, 8))
+        if not exists:
+            self._index[:, SEQ] = -1
+        used = self._index[:, SEQ] >= 0
+        self._slot = int(np.argmax(np.where(used, self._index[:, SEQ], -1))
+                         ) if used.any() else None
+
+    def __len__(self):
+        used = self._index[:, SEQ] >= 0
+        return int(self._index[used, COUNT].sum())
+
+    @property
+    def last_timestamp(self):
+        if self._slot is None:
+            return None
+        return int(self._index[self._slot, END_TS])
+
+    def _start_block(self, ts, lat, lon):
+        if self._slot is None:
+            slot, seq = 0, 0
+        else:
+            slot = (self._slot + 1) % self.blocks
+            seq = int(self._index[self._slot, SEQ]) + 1
+        self._index[slot] = [seq, 1, ts, lat, lon, ts, lat, lon]
+        self._data[slot, 0] = 0
+        self._slot = slot
+
+    #Add one reading. Returns False (and stores nothing) if it isn't newer
+    #than the last one, which is how repeated polls of an unchanged iss-now
+    #get deduplicated.
+    def append(self, timestamp, latitude, longitude):
+        ts = int(timestamp)
+        lat = int(round(float(latitude) * SCALE))
+        lon = int(round(float(longitude) * SCALE))
+        if self._slot is None:
+            self._start_block(ts, lat, lon)
+            return True
+        row = self._index[self._slot]
+        if ts <= row[END_TS]:
+            return False
+        delta = (ts - int(row[END_TS]), lat - int(row[END_LAT]),
+                 _wrap(lon - int(row[END_LON])))
+        fits = all(_INT16.min <= d <= _INT16.max for d in delta)
+        if not fits or row[COUNT] >= self.block_size:
+            #Too big a jump to store as a difference (we were offline for a
+            #while) or the block is full: start a new block.
+            self._start_block(ts, lat, lon)
+            return True
+        self._data[self._slot, row[COUNT]] = delta
+        row[COUNT] += 1
+        row[END_TS], row[END_LAT], row[END_LON] = ts, lat, lon
+        return True
+
+    def _decode(self, slot):
+        row = self._index[slot]
+        count = int(row[COUNT])
+        deltas = np.asarray(self._data[slot, :count], dtype=np.int64)
+        sums = np.cumsum(deltas, axis=0)
+        positions = np.empty(count, dtype=POSITION_DTYPE)
+        positions["timestamp"] = row[BASE_TS] + sums[:, 0]
+        positions["latitude"] = (row[BASE_LAT] + sums[:, 1]) / float(SCALE)
+        positions["longitude"] = _wrap(row[BASE_LON] + sums[:, 2]) / float(
+            SCALE)
+        return positions
+
+    #All readings with start <= timestamp <= end, oldest first, as a
+    #structured array with timestamp, latitude and longitude fields.
+    def between(self, start, end):
+        index = np.asarray(self._index)
+        overlapping = np.nonzero((index[:, SEQ] >= 0) &
+                                 (index[:, BASE_TS] <= end) &
+                                 (index[:, END_TS] >= start))[0]
+        overlapping = overlapping[np.argsort(index[overlapping, SEQ])]
+        if not len(overlapping):
+            return np.empty(0, dtype=POSITION_DTYPE)
+        positions = np.concatenate([self._decode(slot)
+                                    for slot in overlapping])
+        keep = ((positions["timestamp"] >= start) &
+                (positions["timestamp"] <= end))
+        return positions[keep]
+
+    def flush(self):
+        self._data.flush()
+        self._index.flush()
+
+
+class ISSTracker(object):
+
+    #url can point at a local stub that replays recorded iss-now payloads.
+    def __init__(self, store, url=ISS_NOW_URL, interval=5.0, session=None,
+                 timeout=10):
+        self.store = store
+        self.url = url
+        self.interval = interval
+        self.timeout = timeout
+        #One Session keeps the connection to open-notify open between polls
+        #instead of doing a new TCP handshake every few seconds.
+        self.session = session or requests.Session()
+        self.polls = 0
+        self.stored = 0
+        self.errors = 0
+
+    def poll_once(self):
+        self.polls += 1
+        try:
+            response = self.session.get(self.url, timeout=self.timeout)
+            response.raise_for_status()
+            data = json_codec.decode_response(response)
+            position = data["iss_position"]
+            added = self.store.append(data["timestamp"],
+                                      position["latitude"],
+                                      position["longitude"])
+        except (requests.RequestException, ValueError, KeyError):
+            self.errors += 1
+            return False
+        if added:
+            self.stored += 1
+        return added
+
+    #Poll every interval seconds, measured from when each poll was due rather
+    #than when the last one finished, so slow responses don't make the
+    #schedule drift. Runs forever unless polls is given.
+    def run(self, polls=None):
+        next_poll = time.monotonic()
+        done = 0
+        while polls is None or done < polls:
+            self.poll_once()
+            done += 1
+            if done % 100 == 0:
+                self.store.flush()
+            next_poll += self.interval
+            delay = next_poll - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                #We fell more than a whole interval behind; skip ahead
+                #instead of firing a burst of catch-up polls.
+                next_poll = time.monotonic()
+        self.store.flush()
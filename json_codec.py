@@ -0,0 +1,81 @@
+import json
+import os
+
+#Fast JSON decoding for API responses
+
+#Every script decodes responses with the standard library: response.json(),
+#or json.loads(r.text) in youtube_api.py. r.text first decodes the raw bytes
+#into a str, and then json has to walk that str again. orjson and ujson are
+#drop-in JSON libraries written in C (orjson in Rust) that are several times
+#faster, and orjson reads bytes directly, so response.content can go straight
+#in without building the intermediate str.
+
+#This module picks the fastest backend that's installed (orjson, then ujson,
+#then the standard json module) and gives the HTTP clients one way to use it:
+
+#loads(data)             - data can be bytes or str.
+#dumps(obj)              - returns a str, like json.dumps.
+#decode_response(resp)   - loads(resp.content).
+
+#Set the JSON_CODEC environment variable to orjson, ujson or json to force a
+#backend, e.g. to compare them. Decode errors are always a ValueError
+#subclass, whichever backend is in use, so existing except ValueError blocks
+#keep working.
+
+#Anything that needs exact control over the output (sort_keys, separators,
+#indentation), like the fingerprints in change_detect, should keep using the
+#json module directly.
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def _stdlib_loads(data):
+    return json.loads(data)
+
+
+def _stdlib_dumps(obj):
+    return json.dumps(obj)
+
+
+def _orjson_dumps(obj):
+    return orjson.dumps(obj).decode("utf-8")
+
+
+def _ujson_loads(data):
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data).decode("utf-8")
+    return ujson.loads(data)
+
+
+BACKENDS = {"json": (_stdlib_loads, _stdlib_dumps)}
+if ujson is not None:
+    BACKENDS["ujson"] = (_ujson_loads, ujson.dumps)
+if orjson is not None:
+    BACKENDS["orjson"] = (orjson.loads, _orjson_dumps)
+
+
+def _pick_backend():
+    wanted = os.environ.get("JSON_CODEC")
+    if wanted:
+        if wanted not in BACKENDS:
+            raise ImportError("JSON_CODEC=%s but it isn't installed" % wanted)
+        return wanted
+    for name in ("orjson", "ujson", "json"):
+        if name in BACKENDS:
+            return name
+
+
+backend = _pick_backend()
+loads, dumps = BACKENDS[backend]
+
+
+def decode_response(response):
+    return loads(response.content)
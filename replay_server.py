@@ -0,0 +1,269 @@
+import base64
+import contextlib
+import io
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+from urllib3.response import HTTPResponse
+
+#Recording API responses and replaying them locally
+
+#Every script talks to live endpoints (api.github.com, api.open-notify.org,
+#dataquestio.github.io, ...), so none of them can be timed offline or
+#compared between versions: the network noise is bigger than anything we
+#change. This module records the responses once and serves them back from a
+#local server whose latency and bandwidth we choose.
+
+#Cassette          - recorded responses, keyed by method, host, path and
+#                    query string. A lookup with a query string we never
+#                    recorded falls back to any response recorded for the
+#                    same path, which keeps paging and different coordinates
+#                    working. Saved as JSON lines.
+#recording(c)      - while active, every response from requests is added to
+#                    cassette c. Bodies of streamed responses are recorded as
+#                    they came over the wire (still compressed), everything
+#                    else as the decoded content.
+#ReplayServer      - serves a cassette on 127.0.0.1. latency (plus up to
+#                    jitter) is added before each response and bodies are
+#                    sent at bandwidth bytes per second if it's set.
+#redirect(url)     - while active, every request made with requests goes to
+#                    the replay server instead, with the original host as the
+#                    first part of the path. The scripts don't have to change
+#                    at all.
+
+#Recordings that weren't in the cassette get a 404, and ReplayServer.misses
+#counts them.
+
+#Headers that describe the connection or the original transfer, not the
+#content. The replay server sets its own.
+_SKIP_HEADERS = frozenset(["connection", "content-length", "transfer-encoding",
+                           "keep-alive", "date", "server"])
+
+
+def _split(url):
+    parts = urlsplit(url)
+    path = parts.netloc + (parts.path or "/")
+    return path, tuple(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+
+
+class Cassette(object):
+
+    def __init__(self):
+        self._exact = {}
+        self._by_path = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._exact)
+
+    @property
+    def entries(self):
+        with self._lock:
+            return list(self._exact.values())
+
+    #body is bytes; headers a dict. A later recording of the same request
+    #replaces the earlier one.
+    def add(self, method, url, status, headers, body):
+        path, query = _split(url)
+        entry = {"method": method.upper(), "url": url, "status": status,
+                 "headers": dict((name, value) for name, value in
+                                 headers.items()
+                                 if name.lower() not in _SKIP_HEADERS),
+                 "body": body}
+        with self._lock:
+            self._exact[(entry["method"], path, query)] = entry
+            self._by_path[(entry["method"], path)] = entry
+        return entry
+
+    def find(self, method, url):
+        path, query = _split(url)
+        method = method.upper()
+        with self._lock:
+            entry = self._exact.get((method, path, query))
+            if entry is None:
+                entry = self._by_path.get((method, path))
+        return entry
+
+    def save(self, path):
+        with open(path, "w") as f:
+            for entry in self.entries:
+                record = dict(entry)
+                record["body"] = base64.b64encode(entry["body"]).decode(
+                    "ascii")
+                f.write(json.dumps(record, sort_keys=True) + "\n")
+
+    @classmethod
+    def load(cls, path):
+        cassette = cls()
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    cassette.add(record["method"], record["url"],
+                                 record["status"], record["headers"],
+                                 base64.b64decode(record["body"]))
+        return cassette
+
+    def merge(self, other):
+        for entry in other.entries:
+            self.add(entry["method"], entry["url"], entry["status"],
+                     entry["headers"], entry["body"])
+        return self
+
+
+@contextlib.contextmanager
+def recording(cassette):
+    send = requests.Session.send
+
+    def recording_send(self, request, **kwargs):
+        url = request.url
+        response = send(self, request, **kwargs)
+        headers = dict(response.headers)
+        if kwargs.get("stream"):
+            #Keep the wire bytes, and hand the caller a fresh raw stream of
+            #them so it can still read the body the way it meant to.
+            body = response.raw.read(decode_content=False)
+            response.raw = HTTPResponse(
+                body=io.BytesIO(body), headers=response.raw.headers,
+                status=response.status_code, preload_content=False,
+                decode_content=False)
+        else:
+            body = response.content
+            headers.pop("Content-Encoding", None)
+        cassette.add(request.method, url, response.status_code, headers,
+                     body)
+        return response
+
+    requests.Session.send = recording_send
+    try:
+        yield cassette
+    finally:
+        requests.Session.send = send
+
+
+class ReplayServer(object):
+
+    def __init__(self, cassette, latency=0.0, jitter=0.0, bandwidth=None,
+                 port=0, seed=None):
+        self.cassette = cassette
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.served = 0
+        self.misses = 0
+        self.bytes_sent = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port),
+                                           self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d" % self._server.server_address[1]
+
+    def _delay(self):
+        with self._lock:
+            return self.latency + self._rng.uniform(0, self.jitter)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _replay(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                #/<host>/<path>?<query>, as written by redirect().
+                entry = server.cassette.find(self.command,
+                                             "http://" + self.path[1:])
+                time.sleep(server._delay())
+                if entry is None:
+                    with server._lock:
+                        server.misses += 1
+                    status, headers = 404, {"Content-Type":
+                                            "application/json"}
+                    body = b'{"error": "not recorded"}'
+                else:
+                    status, headers, body = (entry["status"],
+                                             entry["headers"], entry["body"])
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                with server._lock:
+                    server.served += 1
+                if self.command != "HEAD":
+                    server._write(self.wfile, body)
+                    with server._lock:
+                        server.bytes_sent += len(body)
+
+            do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _replay
+
+        return Handler
+
+    def _write(self, wfile, body):
+        if not self.bandwidth:
+            wfile.write(body)
+            return
+        #Send in slices small enough that the rate is smooth.
+        step = max(1024, int(self.bandwidth / 50))
+        for start in range(0, len(body), step):
+            chunk = body[start:start + step]
+            wfile.write(chunk)
+            wfile.flush()
+            time.sleep(len(chunk) / float(self.bandwidth))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _rewrite(url, server_url):
+    parts = urlsplit(url)
+    target = "%s/%s%s" % (server_url, parts.netloc, parts.path or "/")
+    if parts.query:
+        target += "?" + urlencode(parse_qsl(parts.query,
+                                            keep_blank_values=True))
+    return target
+
+
+#Send every request made with requests to the replay server at server_url.
+@contextlib.contextmanager
+def redirect(server_url):
+    send = requests.Session.send
+
+    def redirected_send(self, request, **kwargs):
+        request.url = _rewrite(request.url, server_url)
+        return send(self, request, **kwargs)
+
+    requests.Session.send = redirected_send
+    try:
+        yield
+    finally:
+        requests.Session.send = send
@@ -0,0 +1,286 @@
+import codecs
+import collections
+import re
+import zlib
+from html.parser import HTMLParser
+
+import requests
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+
+#brotli is optional. Without it we just don't offer br to the server.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+#What a corrupt compressed body raises.
+_DECODE_ERRORS = (zlib.error,) + ((brotli.error,) if brotli is not None
+                                  else ())
+
+#Streaming page downloads
+
+#response.content reads the whole body into memory before we get to look at
+#any of it. For the small practice pages that's fine, but real pages can be
+#megabytes of HTML where the part we want is near the top.
+
+#fetch_page() asks the server for a compressed response (gzip, deflate and,
+#when the brotli package is installed, br), reads the body a chunk at a time,
+#decompresses each chunk as it arrives and feeds the text to a lightweight
+#HTML tokenizer. We can stop reading as soon as:
+
+#- every CSS selector we asked for has been seen in full (its closing tag has
+#  arrived), or
+#- the page grows past max_bytes, in which case PageTooLarge is raised.
+
+#The bytes read so far are returned, ready to hand to BeautifulSoup. html.parser
+#copes fine with a document that is cut off after the part we care about.
+
+#Only simple selectors are understood by the early-stop check: a tag name, an
+##id, one or more .classes, combinations like td.stat or tr#turnovers, and
+#descendant chains of those separated by spaces (#turnovers td).
+
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+
+FetchedPage = collections.namedtuple(
+    "FetchedPage",
+    ["url", "status_code", "content", "wire_bytes", "complete"])
+
+
+class PageTooLarge(Exception):
+    pass
+
+
+def accept_encoding():
+    encodings = ["gzip", "deflate"]
+    if brotli is not None:
+        encodings.insert(0, "br")
+    return ", ".join(encodings)
+
+
+#zlib's decompress with the output capped at limit bytes (None for no cap).
+#Whatever input doesn't fit is kept in unconsumed_tail, which we keep feeding
+#until either it's used up or we've produced limit bytes.
+def _zlib_decompress(obj, data, limit):
+    out = bytearray()
+    while True:
+        out.extend(obj.decompress(data, limit - len(out) if limit else 0))
+        data = obj.unconsumed_tail
+        if not data or (limit and len(out) >= limit):
+            return bytes(out)
+
+
+def _brotli_decompress(obj, data, limit):
+    if not limit:
+        return obj.process(data)
+    try:
+        out = bytearray(obj.process(data, output_buffer_limit=limit))
+        while len(out) < limit and not obj.can_accept_more_data():
+            out.extend(obj.process(b"", output_buffer_limit=limit - len(out)))
+        return bytes(out)
+    except TypeError:
+        #Older brotli releases have no output limit, so feed the input in
+        #small pieces and stop as soon as we're over.
+        out = bytearray()
+        for start in range(0, len(data), 256):
+            out.extend(obj.process(data[start:start + 256]))
+            if len(out) >= limit:
+                break
+        return bytes(out)
+
+
+#Returns a function decompress(data, limit) that turns one chunk of the raw
+#(still encoded) body into decompressed bytes, producing at most limit bytes
+#when limit is given. Bounding the output, rather than checking its size
+#afterwards, is what keeps a small compressed bomb from ballooning in memory
+#before max_bytes gets a say.
+def _decoder(content_encoding):
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding in ("gzip", "x-gzip"):
+        obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        return lambda data, limit=None: _zlib_decompress(obj, data, limit)
+    if encoding == "deflate":
+        #Servers disagree on whether deflate means a zlib stream or a raw
+        #deflate stream, so we sniff the first chunk.
+        state = {}
+
+        def decompress(data, limit=None):
+            if "obj" not in state:
+                try:
+                    state["obj"] = zlib.decompressobj()
+                    return _zlib_decompress(state["obj"], data, limit)
+                except zlib.error:
+                    state["obj"] = zlib.decompressobj(-zlib.MAX_WBITS)
+            return _zlib_decompress(state["obj"], data, limit)
+        return decompress
+    if encoding == "br":
+        if brotli is None:
+            raise ValueError("server sent brotli but brotli isn't installed")
+        obj = brotli.Decompressor()
+        return lambda data, limit=None: _brotli_decompress(obj, data, limit)
+    if encoding == "identity":
+        return lambda data, limit=None: data
+    raise ValueError("unsupported content encoding: %s" % content_encoding)
+
+
+_COMPOUND = re.compile(r"^([a-zA-Z][\w-]*)?(?:#([\w-]+))?((?:\.[\w-]+)*)$")
+
+
+def _parse_selector(selector):
+    steps = []
+    for part in selector.split():
+        match = _COMPOUND.match(part)
+        if not match:
+            raise ValueError("selector too complex for early stop: %s" %
+                             selector)
+        tag, element_id, classes = match.groups()
+        steps.append((tag and tag.lower(), element_id,
+                      frozenset(c for c in classes.split(".") if c)))
+    return steps
+
+
+def _matches(step, element):
+    tag, element_id, classes = step
+    if tag and element[0] != tag:
+        return False
+    if element_id and element[1] != element_id:
+        return False
+    return classes <= element[2]
+
+
+_VOID_TAGS = frozenset(["area", "base", "br", "col", "embed", "hr", "img",
+                        "input", "link", "meta", "param", "source", "track",
+                        "wbr"])
+
+
+#Watches the tag stream and remembers which selectors have been fully seen.
+class SelectorWatcher(HTMLParser):
+
+    def __init__(self, selectors):
+        HTMLParser.__init__(self, convert_charrefs=False)
+        self.selectors = [_parse_selector(s) for s in selectors]
+        self.seen = [False] * len(self.selectors)
+        self._stack = []
+        #(selector index, stack depth) of matched elements still open.
+        self._open_matches = []
+
+    @property
+    def satisfied(self):
+        return all(self.seen)
+
+    def _match_index(self, element):
+        matched = []
+        for index, steps in enumerate(self.selectors):
+            if self.seen[index] or not _matches(steps[-1], element):
+                continue
+            #Walk the ancestors from the outside in, matching the rest of
+            #the chain in order.
+            position = 0
+            ancestors = steps[:-1]
+            for ancestor in self._stack:
+                if position < len(ancestors) and _matches(
+                        ancestors[position], ancestor):
+                    position += 1
+            if position == len(ancestors):
+                matched.append(index)
+        return matched
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        element = (tag, attrs.get("id"),
+                   frozenset((attrs.get("class") or "").split()))
+        matched = self._match_index(element)
+        if tag in _VOID_TAGS:
+            for index in matched:
+                self.seen[index] = True
+            return
+        self._stack.append(element)
+        for index in matched:
+            self._open_matches.append((index, len(self._stack)))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in _VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        #Pop back to the matching open tag, closing anything left unclosed.
+        for depth in range(len(self._stack), 0, -1):
+            if self._stack[depth - 1][0] == tag:
+                del self._stack[depth - 1:]
+                break
+        else:
+            return
+        still_open = []
+        for index, depth in self._open_matches:
+            if depth > len(self._stack):
+                self.seen[index] = True
+            else:
+                still_open.append((index, depth))
+        self._open_matches = still_open
+
+
+#Download url as a stream. selectors is an optional list of CSS selectors;
+#once all of them have been seen we stop reading the body. The returned
+#FetchedPage.content holds the decompressed bytes we read, wire_bytes is how
+#much actually came over the network and complete tells us whether we read
+#the whole body.
+def fetch_page(url, selectors=None, max_bytes=DEFAULT_MAX_BYTES,
+               session=None, chunk_size=16 * 1024, timeout=30, **kwargs):
+    http = session if session is not None else requests
+    headers = dict(kwargs.pop("headers", None) or {})
+    headers.setdefault("Accept-Encoding", accept_encoding())
+    response = http.get(url, headers=headers, stream=True, timeout=timeout,
+                        **kwargs)
+    try:
+        declared = response.headers.get("Content-Length")
+        content_encoding = response.headers.get("Content-Encoding")
+        if (max_bytes is not None and declared is not None and
+                not content_encoding and int(declared) > max_bytes):
+            raise PageTooLarge("%s is %s bytes, limit is %d" %
+                               (url, declared, max_bytes))
+
+        decompress = _decoder(content_encoding)
+        watcher = SelectorWatcher(selectors) if selectors else None
+        text = codecs.getincrementaldecoder(
+            response.encoding or "utf-8")(errors="replace")
+
+        body = bytearray()
+        wire_bytes = 0
+        complete = True
+        #Reading response.raw ourselves skips requests' own error handling,
+        #so turn urllib3 and decompression errors into the requests
+        #exceptions callers already catch.
+        try:
+            for raw_chunk in response.raw.stream(chunk_size,
+                                                 decode_content=False):
+                wire_bytes += len(raw_chunk)
+                #One byte past the limit is enough to know the page is too
+                #big.
+                limit = (max_bytes - len(body) + 1 if max_bytes is not None
+                         else None)
+                chunk = decompress(raw_chunk, limit)
+                body.extend(chunk)
+                if max_bytes is not None and len(body) > max_bytes:
+                    raise PageTooLarge("%s is over the %d byte limit" %
+                                       (url, max_bytes))
+                if watcher is not None:
+                    watcher.feed(text.decode(chunk))
+                    if watcher.satisfied:
+                        complete = False
+                        break
+        except ProtocolError as error:
+            raise requests.exceptions.ChunkedEncodingError(error)
+        except ReadTimeoutError as error:
+            raise requests.ConnectionError(error)
+        except _DECODE_ERRORS as error:
+            raise requests.exceptions.ContentDecodingError(error)
+        #Older urllib3 releases end the stream quietly when the connection
+        #closes before Content-Length bytes have arrived.
+        if (complete and declared is not None and
+                wire_bytes < int(declared)):
+            raise requests.exceptions.ChunkedEncodingError(
+                "%s ended after %d of %s bytes" % (url, wire_bytes, declared))
+        return FetchedPage(url, response.status_code, bytes(body),
+                           wire_bytes, complete)
+    finally:
+        response.close()
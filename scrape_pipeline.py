@@ -0,0 +1,265 @@
+import collections
+import concurrent.futures
+import os
+import queue
+import threading
+import time
+
+import requests
+from bs4 import BeautifulSoup
+
+from scrape_fetch import DEFAULT_MAX_BYTES, PageTooLarge, fetch_page
+
+#Fetching and parsing in separate stages
+
+#Downloading a page spends almost all of its time waiting on the network, so
+#threads are a good fit for it. Parsing the page with BeautifulSoup is the
+#opposite: it's pure Python work that holds the GIL, so parsing in threads
+#still runs one page at a time. On a big crawl that makes parsing the
+#bottleneck no matter how many fetch threads we start.
+
+#crawl() splits the work into two stages:
+
+#1. A handful of fetcher threads download pages and put the raw bytes on a
+#   bounded queue.
+#2. The main thread hands those bytes to a pool of worker processes, which
+#   build the BeautifulSoup parser and run our extract function.
+
+#Both stages are bounded. When the parse workers fall behind, the number of
+#pages in flight hits its limit, the raw queue fills up and the fetchers block
+#on put() until there's room. That backpressure keeps memory flat instead of
+#letting downloaded pages pile up.
+
+#The extract function runs in another process, so it has to be a plain
+#module-level function (something pickle can find by name). It is called as
+#extract(url, parser) and whatever it returns is sent back to us.
+
+PageResult = collections.namedtuple("PageResult", ["url", "result", "error"])
+
+_DONE = object()
+
+
+class PipelineStats(object):
+
+    def __init__(self):
+        self.pages_fetched = 0
+        self.pages_parsed = 0
+        self.errors = 0
+        self.bytes_fetched = 0
+        self.fetch_seconds = 0.0
+        self.parse_seconds = 0.0
+        self.fetch_wait_seconds = 0.0
+        self.wall_seconds = 0.0
+        self.max_queue_depth = 0
+        self.max_in_flight = 0
+        self._depth_total = 0
+        self._depth_samples = 0
+        self._lock = threading.Lock()
+
+    def record_fetch(self, seconds, size, waited):
+        with self._lock:
+            self.pages_fetched += 1
+            self.bytes_fetched += size
+            self.fetch_seconds += seconds
+            self.fetch_wait_seconds += waited
+
+    def record_parse(self, seconds):
+        with self._lock:
+            self.pages_parsed += 1
+            self.parse_seconds += seconds
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def record_depth(self, depth, in_flight):
+        with self._lock:
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+            self.max_in_flight = max(self.max_in_flight, in_flight)
+            self._depth_total += depth
+            self._depth_samples += 1
+
+    @property
+    def mean_queue_depth(self):
+        if not self._depth_samples:
+            return 0.0
+        return self._depth_total / float(self._depth_samples)
+
+    #A short human readable summary. fetch_wait is the time fetchers spent
+    #blocked on a full queue, which is how we can tell that parsing (and not
+    #the network) is what's holding the crawl back.
+    def report(self):
+        pages_per_second = (self.pages_parsed / self.wall_seconds
+                            if self.wall_seconds else 0.0)
+        lines = [
+            "pages fetched: %d (%d errors, %.1f KB)" % (
+                self.pages_fetched, self.errors, self.bytes_fetched / 1024.0),
+            "pages parsed: %d (%.1f pages/s over %.2fs)" % (
+                self.pages_parsed, pages_per_second, self.wall_seconds),
+            "fetch time: %.2fs total, %.2fs blocked on a full queue" % (
+                self.fetch_seconds, self.fetch_wait_seconds),
+            "parse time: %.2fs total across workers" % self.parse_seconds,
+            "raw queue depth: max %d, mean %.1f; max pages in flight %d" % (
+                self.max_queue_depth, self.mean_queue_depth,
+                self.max_in_flight),
+        ]
+        return "\n".join(lines)
+
+
+#This runs inside a worker process.
+def _parse_page(extract, url, content):
+    started = time.time()
+    parser = BeautifulSoup(content, "html.parser")
+    result = extract(url, parser)
+    return result, time.time() - started
+
+
+#Put item on the queue unless the crawl is stopped first. Returns whether it
+#went in.
+def _put(raw, item, stop):
+    while not stop.is_set():
+        try:
+            raw.put(item, timeout=0.05)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+#crawl() waits for a _DONE from every fetcher, so it's sent however the
+#thread ends.
+def _fetch_worker(session, urls, raw, stats, timeout, selectors, max_bytes,
+                  stop):
+    try:
+        while not stop.is_set():
+            try:
+                url = urls.get_nowait()
+            except queue.Empty:
+                break
+            started = time.time()
+            try:
+                page = fetch_page(url, selectors=selectors,
+                                  max_bytes=max_bytes, session=session,
+                                  timeout=timeout)
+                if page.status_code >= 400:
+                    raise requests.HTTPError("%d error for %s" %
+                                             (page.status_code, url))
+                item = (url, page.content, None)
+            except (requests.RequestException, PageTooLarge,
+                    ValueError) as error:
+                item = (url, None, error)
+            fetched = time.time()
+            if not _put(raw, item, stop):
+                return
+            size = len(item[1]) if item[1] is not None else 0
+            stats.record_fetch(fetched - started, size,
+                               time.time() - fetched)
+    finally:
+        _put(raw, _DONE, stop)
+
+
+#Fetch every url, parse it in a process pool and yield a PageResult for each
+#page as soon as its extract call finishes (so not necessarily in url order).
+
+#fetchers      - number of download threads.
+#parse_workers - number of worker processes; defaults to one per core.
+#queue_size    - how many downloaded-but-not-yet-dispatched pages may wait.
+#selectors     - CSS selectors extract needs; downloads stop once they're seen
+#                (see scrape_fetch.fetch_page).
+#max_bytes     - pages bigger than this are reported as errors.
+#stats         - pass in a PipelineStats to read the timings afterwards.
+def crawl(urls, extract, fetchers=8, parse_workers=None, queue_size=32,
+          timeout=30, stats=None, session=None, selectors=None,
+          max_bytes=DEFAULT_MAX_BYTES):
+    stats = stats if stats is not None else PipelineStats()
+    session = session if session is not None else requests.Session()
+    started = time.time()
+
+    pending_urls = queue.Queue()
+    for url in urls:
+        pending_urls.put(url)
+    raw = queue.Queue(maxsize=queue_size)
+    finished = queue.Queue()
+    stop = threading.Event()
+
+    threads = [threading.Thread(target=_fetch_worker,
+                                args=(session, pending_urls, raw, stats,
+                                      timeout, selectors, max_bytes, stop))
+               for _ in range(fetchers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    workers = parse_workers or os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        #Keep about two pages per worker in flight: one being parsed and one
+        #queued up behind it so no worker sits idle waiting on us.
+        in_flight = threading.BoundedSemaphore(workers * 2)
+        counter = {"in_flight": 0}
+        counter_lock = threading.Lock()
+        submitted = set()
+
+        def on_done(future, url):
+            try:
+                result, seconds = future.result()
+                stats.record_parse(seconds)
+                finished.put(PageResult(url, result, None))
+            except concurrent.futures.CancelledError:
+                pass
+            except Exception as error:
+                stats.record_error()
+                finished.put(PageResult(url, None, error))
+            with counter_lock:
+                counter["in_flight"] -= 1
+                submitted.discard(future)
+            in_flight.release()
+
+        try:
+            fetchers_left = fetchers
+            while fetchers_left:
+                while not finished.empty():
+                    yield finished.get()
+                try:
+                    item = raw.get(timeout=0.05)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    fetchers_left -= 1
+                    continue
+                url, content, error = item
+                if error is not None:
+                    stats.record_error()
+                    yield PageResult(url, None, error)
+                    continue
+                in_flight.acquire()
+                future = pool.submit(_parse_page, extract, url, content)
+                with counter_lock:
+                    counter["in_flight"] += 1
+                    submitted.add(future)
+                    depth = counter["in_flight"]
+                stats.record_depth(raw.qsize(), depth)
+                future.add_done_callback(
+                    lambda future, url=url: on_done(future, url))
+
+            while counter["in_flight"] or not finished.empty():
+                try:
+                    yield finished.get(timeout=0.05)
+                except queue.Empty:
+                    continue
+        finally:
+            #If the caller stopped iterating early, let the fetchers go, throw
+            #away what they downloaded and cancel the parses that haven't
+            #started, so leaving the pool only waits on the running ones.
+            stop.set()
+            while True:
+                try:
+                    raw.get_nowait()
+                except queue.Empty:
+                    break
+            with counter_lock:
+                pending = list(submitted)
+            for future in pending:
+                future.cancel()
+            #Here rather than after the loop, so it's recorded when the
+            #caller stops early too.
+            stats.wall_seconds = time.time() - started
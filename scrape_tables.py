@@ -0,0 +1,156 @@
+import numpy as np
+import pandas as pd
+from bs4 import BeautifulSoup
+
+#Turning HTML tables into DataFrames
+
+#In Webscraping_Dataquest.py we pull single td cells out of a table by hand and
+#end up with scalar strings like "396". That's fine for one number, but when we
+#scrape a whole box score (or a whole season of box scores) we want every row
+#of every table as typed pandas columns.
+
+#TableFrameBuilder reads tr rows as they are parsed and keeps at most
+#chunk_size rows of cell text around at a time. Whenever the buffer fills up,
+#it is converted into a typed DataFrame chunk (numbers become int/float
+#columns, everything else stays text) and the raw strings are thrown away. We
+#never hold a Python list of every cell on every page, only one chunk's worth.
+
+#Chunks can either be collected and concatenated at the end with frame(), or
+#handed to an on_chunk callback (for example one that appends to a CSV or a
+#SQL table) so nothing accumulates in memory at all.
+
+
+def _cell_text(cell):
+    return cell.get_text(strip=True)
+
+
+#Figure out the dtype for a column of strings. A column is numeric only if
+#every non-empty value parses as a number; otherwise we keep it as text.
+def _infer_dtype(values):
+    non_empty = [v for v in values if v != ""]
+    if not non_empty:
+        return object
+    numbers = pd.to_numeric(pd.Series(non_empty), errors="coerce")
+    if numbers.isnull().any():
+        return object
+    if (numbers == np.floor(numbers)).all() and len(non_empty) == len(values):
+        return np.int64
+    return np.float64
+
+
+#Returns None if a non-empty value isn't a number, so the caller can decide
+#what to do with the column instead of losing the value to NaN.
+def _convert(values, dtype):
+    if dtype is object:
+        return np.array(values, dtype=object)
+    series = pd.Series(values).replace("", np.nan)
+    numbers = pd.to_numeric(series, errors="coerce")
+    if (numbers.isnull() & series.notnull()).any():
+        return None
+    if dtype is np.int64 and (numbers.isnull().any() or
+                              (numbers != np.floor(numbers)).any()):
+        #A later chunk had gaps or fractions in an integer column, so fall
+        #back to floats for this chunk. pd.concat upcasts the other chunks.
+        return numbers.astype(np.float64).values
+    return numbers.astype(dtype).values
+
+
+class TableFrameBuilder(object):
+
+    #columns   - column names. If left out, they're taken from the first row of
+    #            th cells we see.
+    #dtypes    - optional {column: dtype} overrides; any column not listed is
+    #            inferred from the first chunk and then kept fixed so every
+    #            chunk lines up. If a later chunk has text in an inferred
+    #            numeric column ("7-14", "N/A"), the column becomes object
+    #            from that chunk on and pd.concat upcasts the earlier chunks.
+    #            Text in a column given here raises ValueError instead.
+    #chunk_size - how many rows to buffer before converting to a DataFrame.
+    #on_chunk  - optional callback that receives each typed DataFrame chunk.
+    #            When given, chunks are not kept by the builder.
+    def __init__(self, columns=None, dtypes=None, chunk_size=10000,
+                 on_chunk=None):
+        self.columns = list(columns) if columns is not None else None
+        self.dtypes = dict(dtypes or {})
+        self._fixed = set(self.dtypes)
+        self.chunk_size = chunk_size
+        self.on_chunk = on_chunk
+        self.rows_seen = 0
+        self._buffers = None
+        self._buffered = 0
+        self._chunks = []
+
+    def _start_buffers(self):
+        self._buffers = [[] for _ in self.columns]
+        self._buffered = 0
+
+    #Add one row of cell strings. Short rows are padded with empty cells and
+    #extra cells are dropped, since scraped tables are rarely perfectly square.
+    def add_row(self, cells):
+        if self.columns is None:
+            raise ValueError("columns must be known before rows are added")
+        if self._buffers is None:
+            self._start_buffers()
+        for i, buffer in enumerate(self._buffers):
+            buffer.append(cells[i] if i < len(cells) else "")
+        self._buffered += 1
+        self.rows_seen += 1
+        if self._buffered >= self.chunk_size:
+            self.flush()
+
+    #Walk the tr elements of a table (a BeautifulSoup Tag or raw HTML).
+    #A row made only of th cells becomes the header when we don't have one yet;
+    #every row with td cells becomes data.
+    def add_table(self, table):
+        if not hasattr(table, "find_all"):
+            table = BeautifulSoup(table, "html.parser").find("table")
+        for tr in table.find_all("tr"):
+            cells = tr.find_all(["td", "th"])
+            if not cells:
+                continue
+            if all(cell.name == "th" for cell in cells):
+                if self.columns is None:
+                    self.columns = [_cell_text(cell) or "column_%d" % i
+                                    for i, cell in enumerate(cells)]
+                continue
+            self.add_row([_cell_text(cell) for cell in cells])
+        return self
+
+    #Convert whatever is buffered into a typed DataFrame chunk.
+    def flush(self):
+        if not self._buffered:
+            return None
+        data = {}
+        for name, values in zip(self.columns, self._buffers):
+            if name not in self.dtypes:
+                self.dtypes[name] = _infer_dtype(values)
+            converted = _convert(values, self.dtypes[name])
+            if converted is None:
+                if name in self._fixed:
+                    raise ValueError("column %s has values that aren't %s" %
+                                     (name, np.dtype(self.dtypes[name])))
+                self.dtypes[name] = object
+                converted = _convert(values, object)
+            data[name] = converted
+        chunk = pd.DataFrame(data, columns=self.columns)
+        self._start_buffers()
+        if self.on_chunk is not None:
+            self.on_chunk(chunk)
+        else:
+            self._chunks.append(chunk)
+        return chunk
+
+    #Flush any remaining rows and return everything we've collected as a
+    #single DataFrame.
+    def frame(self):
+        self.flush()
+        if not self._chunks:
+            return pd.DataFrame(columns=self.columns or [])
+        if len(self._chunks) == 1:
+            return self._chunks[0]
+        return pd.concat(self._chunks, ignore_index=True)
+
+
+#Shortcut for the common case of one table on one page.
+def table_to_frame(table, **kwargs):
+    return TableFrameBuilder(**kwargs).add_table(table).frame()
@@ -0,0 +1,191 @@
+import concurrent.futures
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+
+import api_http
+import json_codec
+from token_bucket import TokenBucket
+from urllib3.exceptions import NewConnectionError
+
+#Sending the ISS text to lots of people
+
+#Beginning_with_APIs.py works out how many people are in space and sends one
+#text to one number with client.messages.create(...). NotificationDispatcher
+#takes a whole list of recipients instead and:
+
+#- sends from a bounded thread pool, so a few slow requests to Twilio don't
+#  hold up everyone else;
+#- goes through a token bucket, because Twilio only lets each account send so
+#  many messages a second (one a second on a regular long code number);
+#- drops duplicate numbers, and skips anyone who already got this
+#  notification, so running the same dispatch again doesn't text them twice;
+#- writes every delivery to a state file as soon as Twilio accepts it. If the
+#  run crashes or some sends fail, running it again only sends the messages
+#  that haven't gone out yet.
+
+#Messages are sent by a sender: any function send(to, from_, body) that
+#returns the message sid. TwilioRestSender posts straight to Twilio's REST
+#API, and base_url can point it at a local stand-in server instead.
+#twilio_client_sender wraps the Client from the twilio package.
+
+#What counts as "this notification" is up to the caller. Pass a message_id to
+#dispatch() and a number is skipped only if it already got that id. For the
+#astros text, the previous and new ChangeDetector fingerprints together make a
+#good id: the same for every retry of one crew change, different for the next
+#change even when the count goes back to an earlier number. Without a
+#message_id the text itself is the id, so the same text never goes to the same
+#number twice: fine for one-off announcements, wrong for a count like 7, 6, 7.
+
+TWILIO_API_URL = "https://api.twilio.com"
+
+
+class SendError(Exception):
+
+    def __init__(self, message, retry=False):
+        Exception.__init__(self, message)
+        self.retry = retry
+
+
+class TwilioRestSender(object):
+
+    def __init__(self, account_sid, auth_token, base_url=TWILIO_API_URL,
+                 session=None, timeout=15):
+        self.url = "%s/2010-04-01/Accounts/%s/Messages.json" % (
+            base_url.rstrip("/"), account_sid)
+        self.auth = (account_sid, auth_token)
+        self.session = session or requests.Session()
+        self.timeout = timeout
+
+    #Only failures where Twilio can't have taken the message are retried:
+    #no connection, or a 429. After a read timeout or a 5xx the message may
+    #well have been accepted, and sending it again would text someone twice.
+    def __call__(self, to, from_, body):
+        try:
+            response = self.session.post(self.url, auth=self.auth,
+                                         data={"To": to, "From": from_,
+                                               "Body": body},
+                                         timeout=self.timeout)
+        except requests.RequestException as error:
+            raise SendError(str(error), retry=_never_sent(error))
+        if response.status_code == 429:
+            raise SendError("Twilio returned 429", retry=True)
+        if response.status_code >= 400:
+            raise SendError("Twilio returned %d: %s" % (response.status_code,
+                                                        response.text))
+        return json_codec.decode_response(response)["sid"]
+
+
+#True if the request never reached Twilio.
+def _never_sent(error):
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.ConnectionError):
+        reason = getattr(error.args[0] if error.args else None, "reason", None)
+        return isinstance(reason, NewConnectionError)
+    return False
+
+
+def twilio_client_sender(client):
+    def send(to, from_, body):
+        return client.messages.create(to=to, from_=from_, body=body).sid
+    return send
+
+
+def message_key(to, body, message_id=None):
+    if message_id is not None:
+        body = "id:%s" % message_id
+    return hashlib.sha1((to + "\n" + body).encode("utf-8")).hexdigest()
+
+
+class NotificationDispatcher(object):
+
+    #sender       - function(to, from_, body) returning the message sid.
+    #from_        - the Twilio number we send from.
+    #state_path   - JSON lines file recording what's been delivered.
+    #rate         - (messages, per seconds) allowed for the account.
+    def __init__(self, sender, from_, state_path="sms_state.jsonl",
+                 workers=8, rate=(1, 1), max_attempts=3, sleep=time.sleep):
+        self.sender = sender
+        self.from_ = from_
+        self.state_path = state_path
+        self.workers = workers
+        self.bucket = TokenBucket(*rate)
+        self.max_attempts = max_attempts
+        self.sleep = sleep
+        self.delivered = self._load()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        delivered = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    delivered[entry["key"]] = entry
+        return delivered
+
+    def _record(self, key, to, sid):
+        entry = {"key": key, "to": to, "sid": sid, "sent_at": time.time()}
+        with self._lock:
+            self.delivered[key] = entry
+            with open(self.state_path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _send(self, to, body):
+        for attempt in range(self.max_attempts):
+            self.bucket.acquire()
+            try:
+                return self.sender(to, self.from_, body)
+            except SendError as error:
+                if not error.retry or attempt + 1 == self.max_attempts:
+                    raise
+                api_http.note_retry(getattr(self.sender, "url",
+                                            TWILIO_API_URL), "send_error")
+                self.sleep(2 ** attempt)
+
+    def _deliver(self, to, body, message_id):
+        key = message_key(to, body, message_id)
+        try:
+            sid = self._send(to, body)
+        except Exception as error:
+            return to, None, error
+        self._record(key, to, sid)
+        return to, sid, None
+
+    #Send body to every number in recipients. Returns a dict with the sids
+    #of what was sent, the numbers skipped as already sent, and the errors
+    #for anything that failed (those will be tried again on the next call
+    #with the same message_id).
+    def dispatch(self, recipients, body, message_id=None):
+        todo = []
+        skipped = []
+        seen = set()
+        for to in recipients:
+            if to in seen:
+                continue
+            seen.add(to)
+            if message_key(to, body, message_id) in self.delivered:
+                skipped.append(to)
+            else:
+                todo.append(to)
+
+        sent = {}
+        failed = {}
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+            for to, sid, error in pool.map(
+                    lambda to: self._deliver(to, body, message_id), todo):
+                if error is None:
+                    sent[to] = sid
+                else:
+                    failed[to] = error
+        return {"sent": sent, "skipped": skipped, "failed": failed}
@@ -0,0 +1,172 @@
+import gzip
+import threading
+import tracemalloc
+import unittest
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from scrape_fetch import PageTooLarge, fetch_page
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+#fetch_page against a local server that serves the same page with each
+#Content-Encoding. The table we look for is at the top, followed by a lot of
+#filler, so early stop has something to skip.
+
+PAGE = (b"<html><body><table id='turnovers'><tr><td class='stat'>396</td>"
+        b"</tr></table>" +
+        b"".join(b"<p>filler %d</p>" % (i * 7919 % 100003)
+                 for i in range(50000)) +
+        b"</body></html>")
+
+
+def _raw_deflate(data):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+#path -> (Content-Encoding, body)
+FIXTURES = {
+    "/identity": (None, PAGE),
+    "/gzip": ("gzip", gzip.compress(PAGE)),
+    "/deflate-zlib": ("deflate", zlib.compress(PAGE)),
+    "/deflate-raw": ("deflate", _raw_deflate(PAGE)),
+    #About 200 KB that inflates to 200 MB.
+    "/bomb": ("gzip", gzip.compress(b"\0" * (200 * 1024 * 1024))),
+    #Says it's gzip but isn't.
+    "/corrupt": ("gzip", b"this is not gzip data" * 100),
+}
+
+#Paths whose response promises this many bytes but stops after the first
+#few and closes the connection.
+TRUNCATED = {"/truncated": 100000}
+if brotli is not None:
+    FIXTURES["/br"] = ("br", brotli.compress(PAGE))
+    FIXTURES["/br-bomb"] = ("br", brotli.compress(b"\0" * (200 * 1024 * 1024),
+                                                  quality=1))
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path in TRUNCATED:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(TRUNCATED[self.path]))
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(PAGE[:200])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        encoding, body = FIXTURES[self.path]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class FetchPageTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        cls.server.daemon_threads = True
+        thread = threading.Thread(target=cls.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        cls.session = requests.Session()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.session.close()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def url(self, path):
+        return "http://127.0.0.1:%d%s" % (self.server.server_address[1],
+                                           path)
+
+    def fetch(self, path, **kwargs):
+        return fetch_page(self.url(path), session=self.session, **kwargs)
+
+    def check_whole_page(self, path):
+        page = self.fetch(path)
+        self.assertEqual(page.status_code, 200)
+        self.assertEqual(page.content, PAGE)
+        self.assertTrue(page.complete)
+        self.assertEqual(page.wire_bytes, len(FIXTURES[path][1]))
+
+    def test_identity(self):
+        self.check_whole_page("/identity")
+
+    def test_gzip(self):
+        self.check_whole_page("/gzip")
+
+    def test_deflate_zlib_stream(self):
+        self.check_whole_page("/deflate-zlib")
+
+    def test_deflate_raw_stream(self):
+        self.check_whole_page("/deflate-raw")
+
+    @unittest.skipIf(brotli is None, "brotli isn't installed")
+    def test_brotli(self):
+        self.check_whole_page("/br")
+
+    def test_early_stop(self):
+        for path in ("/identity", "/gzip"):
+            page = self.fetch(path, selectors=["#turnovers td.stat"])
+            self.assertFalse(page.complete)
+            self.assertIn(b"<td class='stat'>396</td>", page.content)
+            self.assertLess(page.wire_bytes, len(FIXTURES[path][1]))
+
+    def test_size_limit(self):
+        with self.assertRaises(PageTooLarge):
+            self.fetch("/identity", max_bytes=64 * 1024)
+
+    #A connection that closes early or a body that won't decompress has to
+    #come out as a requests exception, which is what callers catch.
+    def test_truncated_body(self):
+        with self.assertRaises(requests.RequestException):
+            self.fetch("/truncated")
+
+    def test_corrupt_body(self):
+        with self.assertRaises(requests.RequestException):
+            self.fetch("/corrupt")
+
+    #A small compressed body that inflates enormously has to be stopped
+    #without ever holding much more than max_bytes.
+    def check_bomb(self, path):
+        tracemalloc.start()
+        try:
+            with self.assertRaises(PageTooLarge):
+                self.fetch(path, max_bytes=1024 * 1024)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, 8 * 1024 * 1024)
+
+    def test_size_limit_bounds_gzip(self):
+        self.check_bomb("/bomb")
+
+    @unittest.skipIf(brotli is None, "brotli isn't installed")
+    def test_size_limit_bounds_brotli(self):
+        self.check_bomb("/br-bomb")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import threading
+import time
+
+#A token bucket rate limiter
+
+#The bucket holds up to `calls` tokens and refills at calls/per tokens a
+#second. Each acquire() takes one token, sleeping until one is available, so
+#we can burst up to `calls` at once but never average more than calls per
+#`per` seconds. It's shared safely between threads.
+
+
+class TokenBucket(object):
+
+    def __init__(self, calls, per, clock=time.time, sleep=time.sleep):
+        self.capacity = float(calls)
+        self.rate = calls / float(per)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens +
+                                  (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+    #(tokens, updated) for saving, and restore() to put it back, so a
+    #restarted process doesn't start with a full bucket. updated is a clock()
+    #reading, so this only makes sense with a wall clock like time.time.
+    def state(self):
+        with self._lock:
+            return self.tokens, self._updated
+
+    def restore(self, tokens, updated):
+        with self._lock:
+            self.tokens = min(self.capacity, max(0.0, float(tokens)))
+            self._updated = min(float(updated), self.clock())
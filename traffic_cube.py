@@ -0,0 +1,166 @@
+import os
+
+import numpy as np
+
+from traffic_stream import FILENAME, iter_batches
+
+#A precomputed count cube for the traffic stops
+
+#The weekday and hour histograms (plt.hist(stops["date"].dt.weekday, bins=6)
+#and dt.hour, bins=24) and the rush hour filter all go back over every row in
+#stops each time they're drawn. They only ever need counts, though, so
+#StopCube counts the stops once by
+
+#hour of day (24) x weekday (7, Monday is 0) x subagency x violation_type
+
+#and keeps the result as a numpy array. A histogram, or "weekday mornings in
+#the 3rd district", is then a sum over a few axes of a small array instead of
+#a scan of millions of rows.
+
+#Each batch of rows is counted with one np.bincount over the flattened cell
+#index, so counting is vectorized too. New batches can be added at any time
+#with update(); subagencies and violation types we haven't seen before just
+#add new slices to the cube. save() and load() keep it on disk as an .npz
+#file, so dashboards can read the cube without touching md_traffic.json.
+
+CUBE_COLUMNS = ["date_of_stop", "time_of_stop", "subagency",
+                "violation_type"]
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday",
+            "Saturday", "Sunday"]
+
+
+class StopCube(object):
+
+    def __init__(self, counts=None, subagencies=(), violation_types=()):
+        self.subagencies = list(subagencies)
+        self.violation_types = list(violation_types)
+        if counts is None:
+            counts = np.zeros((24, 7, len(self.subagencies),
+                               len(self.violation_types)), dtype=np.int64)
+        self.counts = counts
+        self.skipped = 0
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    def _codes(self, values, vocabulary):
+        lookup = dict((value, code) for code, value in enumerate(vocabulary))
+        codes = np.empty(len(values), dtype=np.int64)
+        for i, value in enumerate(values):
+            code = lookup.get(value)
+            if code is None:
+                code = len(vocabulary)
+                vocabulary.append(value)
+                lookup[value] = code
+            codes[i] = code
+        return codes
+
+    def _grow(self):
+        extra_s = len(self.subagencies) - self.counts.shape[2]
+        extra_v = len(self.violation_types) - self.counts.shape[3]
+        if extra_s or extra_v:
+            self.counts = np.pad(self.counts,
+                                 ((0, 0), (0, 0), (0, extra_s), (0, extra_v)),
+                                 mode="constant")
+
+    #Add a batch of rows. Each row is [date_of_stop, time_of_stop, subagency,
+    #violation_type]; use columns=CUBE_COLUMNS when streaming the file.
+    def update(self, rows):
+        if not len(rows):
+            return
+        dates = np.array([row[0][:10] if row[0] else "NaT" for row in rows],
+                         dtype="datetime64[D]")
+        hours = np.array([int(row[1][:2]) if row[1] and row[1][:2].isdigit()
+                          else -1 for row in rows], dtype=np.int64)
+        valid = ~np.isnat(dates) & (hours >= 0) & (hours < 24)
+        self.skipped += int((~valid).sum())
+        if not valid.any():
+            return
+        #1970-01-01 was a Thursday, which is weekday 3 counting Monday as 0.
+        weekdays = (dates[valid].astype(np.int64) + 3) % 7
+        kept = [row for row, ok in zip(rows, valid) if ok]
+        subagencies = self._codes([row[2] for row in kept], self.subagencies)
+        violations = self._codes([row[3] for row in kept],
+                                 self.violation_types)
+        self._grow()
+        shape = self.counts.shape
+        cells = np.ravel_multi_index((hours[valid], weekdays, subagencies,
+                                      violations), shape)
+        self.counts += np.bincount(cells, minlength=self.counts.size
+                                   ).reshape(shape)
+
+    @classmethod
+    def from_file(cls, filename=FILENAME, batch_size=100000,
+                  column_names=None):
+        cube = cls()
+        for batch in iter_batches(filename, CUBE_COLUMNS, batch_size,
+                                  column_names):
+            cube.update(batch)
+        return cube
+
+    def _indices(self, values, vocabulary):
+        if values is None:
+            return slice(None)
+        if isinstance(values, (str, int)):
+            values = [values]
+        lookup = dict((value, code) for code, value in enumerate(vocabulary))
+        return [lookup[value] for value in values if value in lookup]
+
+    #Counts of the cells matching the filters. Each filter is None (all), one
+    #value or a list of values; hours and weekdays are numbers.
+    def select(self, hours=None, weekdays=None, subagencies=None,
+               violation_types=None):
+        counts = self.counts
+        if hours is not None:
+            counts = counts[self._indices(hours, range(24)), :, :, :]
+        if weekdays is not None:
+            counts = counts[:, self._indices(weekdays, range(7)), :, :]
+        if subagencies is not None:
+            counts = counts[:, :, self._indices(subagencies,
+                                                self.subagencies), :]
+        if violation_types is not None:
+            counts = counts[:, :, :, self._indices(violation_types,
+                                                   self.violation_types)]
+        return counts
+
+    def count(self, **filters):
+        return int(self.select(**filters).sum())
+
+    #Stops per hour of day (24 values) after applying filters.
+    def by_hour(self, **filters):
+        return self.select(**filters).sum(axis=(1, 2, 3))
+
+    #Stops per weekday, Monday first (7 values) after applying filters.
+    def by_weekday(self, **filters):
+        return self.select(**filters).sum(axis=(0, 2, 3))
+
+    def by_subagency(self, **filters):
+        return dict(zip(self.subagencies,
+                        self.select(**filters).sum(axis=(0, 1, 3))))
+
+    #Weekday morning rush hour, the same filter the script applies to
+    #last_year: weekday < 5 and 5 < hour < 10.
+    def morning_rush(self, **filters):
+        return self.count(hours=[6, 7, 8, 9], weekdays=[0, 1, 2, 3, 4],
+                          **filters)
+
+    #The vocabularies are stored as fixed-width unicode arrays rather than
+    #object arrays, so loading never has to unpickle anything.
+    def save(self, path):
+        tmp = path + ".tmp.npz"
+        np.savez_compressed(tmp, counts=self.counts,
+                            subagencies=np.array(self.subagencies, dtype=str),
+                            violation_types=np.array(self.violation_types,
+                                                     dtype=str),
+                            skipped=np.array(self.skipped))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            cube = cls(data["counts"], data["subagencies"].tolist(),
+                       data["violation_types"].tolist())
+            cube.skipped = int(data["skipped"])
+        return cube
@@ -0,0 +1,161 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+#Cleaning up make, model and color
+
+#make, model and color in the stops data are typed in by hand, so the same
+#car shows up as "TOYOTA", "TOYT", "TOYO" and "toyota ", and
+#stops["make"].value_counts() splits it across all of them. Normalizer maps
+#each raw value to one canonical spelling.
+
+#There are millions of stops but only a few thousand different raw values, so
+#the work is done per distinct value, not per row:
+
+#  - each column is factorized into integer codes and its distinct values
+#  - each distinct value is looked up in a memo table (one per field), and
+#    only values never seen before go through the cleaning rules
+#  - the codes are remapped with one numpy take into a pandas Categorical of
+#    the canonical values
+
+#The memo tables stay filled between calls, so normalizing the next batch of
+#rows, or the next snapshot, only cleans values that are actually new.
+
+MISSING = frozenset(["", "N/A", "NA", "NONE", "UNK", "UNKNOWN", "XX"])
+
+#Abbreviations that show up in the data (mostly the 4 letter NCIC codes used
+#on citations) and other spellings of the same make.
+MAKE_ALIASES = {
+    "ACUR": "ACURA", "AUDI": "AUDI", "BMW": "BMW", "BUIC": "BUICK",
+    "CADI": "CADILLAC", "CHEV": "CHEVROLET", "CHEVY": "CHEVROLET",
+    "CHEVERLET": "CHEVROLET", "CHEVORLET": "CHEVROLET", "CHRY": "CHRYSLER",
+    "DODG": "DODGE", "FORD": "FORD", "FRHT": "FREIGHTLINER", "GMC": "GMC",
+    "HOND": "HONDA", "HONDAI": "HONDA", "HUMM": "HUMMER", "HYUN": "HYUNDAI",
+    "HYUNDIA": "HYUNDAI", "INFI": "INFINITI", "INFINITY": "INFINITI",
+    "INTL": "INTERNATIONAL", "ISU": "ISUZU", "ISUZ": "ISUZU", "JAGU": "JAGUAR",
+    "JEEP": "JEEP", "KIA": "KIA", "LEXS": "LEXUS", "LEXU": "LEXUS",
+    "LINC": "LINCOLN", "MAZD": "MAZDA", "MERZ": "MERCEDES-BENZ",
+    "MERCEDES": "MERCEDES-BENZ", "MERCEDES BENZ": "MERCEDES-BENZ",
+    "MERCEDEZ": "MERCEDES-BENZ", "MNNI": "MINI", "MITS": "MITSUBISHI",
+    "NISS": "NISSAN", "NISSIAN": "NISSAN", "PONT": "PONTIAC",
+    "PORS": "PORSCHE", "SATU": "SATURN", "SUBA": "SUBARU", "SUZI": "SUZUKI",
+    "TOYO": "TOYOTA", "TOYT": "TOYOTA", "TOYOT": "TOYOTA", "TOYOYA": "TOYOTA",
+    "TOYTA": "TOYOTA", "VOLK": "VOLKSWAGEN", "VW": "VOLKSWAGEN",
+    "VOLKS": "VOLKSWAGEN", "VOLV": "VOLVO",
+}
+
+MAKES = frozenset(MAKE_ALIASES.values()) | frozenset([
+    "MERCURY", "LAND ROVER", "SAAB", "SCION", "TESLA", "FIAT", "MINI"])
+
+COLOR_ALIASES = {
+    "GREY": "GRAY", "SILVR": "SILVER", "BLK": "BLACK", "WHI": "WHITE",
+    "WHT": "WHITE", "BLU": "BLUE", "GRN": "GREEN", "MAR": "MAROON",
+    "BRO": "BROWN", "BRN": "BROWN", "GLD": "GOLD",
+}
+
+_PUNCTUATION = re.compile(r"[^A-Z0-9&\- ]+")
+_SPACES = re.compile(r"\s+")
+
+
+def clean_text(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    value = str(value).upper().strip()
+    if value in MISSING:
+        return None
+    return _SPACES.sub(" ", _PUNCTUATION.sub(" ", value)).strip() or None
+
+
+def normalize_make(value):
+    value = clean_text(value)
+    if value is None:
+        return None
+    if value in MAKE_ALIASES:
+        return MAKE_ALIASES[value]
+    if value in MAKES:
+        return value
+    #A truncated make, e.g. "MITSU" or "VOLKSW", if only one make fits.
+    if len(value) >= 3:
+        matches = [make for make in MAKES if make.startswith(value)]
+        if len(matches) == 1:
+            return matches[0]
+    return value
+
+
+def normalize_model(value):
+    value = clean_text(value)
+    if value is None:
+        return None
+    #Some models have the make typed in front: "TOYOTA CAMRY", "HOND CIVIC".
+    words = value.split(" ", 1)
+    if len(words) == 2 and (words[0] in MAKES or words[0] in MAKE_ALIASES):
+        value = words[1]
+    #"CR-V", "CR V" and "CRV" are all the same model.
+    return value.replace(" ", "").replace("-", "")
+
+
+def normalize_color(value):
+    value = clean_text(value)
+    if value is None:
+        return None
+    #Shades are recorded as "BLUE, DARK" / "GREEN, LGT"; keep the base color.
+    value = value.split(" ")[0]
+    return COLOR_ALIASES.get(value, value)
+
+
+RULES = {
+    "make": normalize_make,
+    "model": normalize_model,
+    "color": normalize_color,
+}
+
+
+class Normalizer(object):
+
+    def __init__(self, rules=None):
+        self.rules = dict(RULES if rules is None else rules)
+        self.tables = dict((field, {}) for field in self.rules)
+        self.cleaned = 0
+
+    def normalize_value(self, field, value):
+        table = self.tables[field]
+        try:
+            return table[value]
+        except KeyError:
+            self.cleaned += 1
+            canonical = table[value] = self.rules[field](value)
+            return canonical
+
+    #A Categorical of the canonical values of one column. The cleaning rules
+    #run at most once per distinct raw value.
+    def normalize_series(self, values, field):
+        codes, uniques = pd.factorize(pd.Series(values), sort=False)
+        canonical = [self.normalize_value(field, value) for value in uniques]
+        categories = sorted(set(value for value in canonical
+                                if value is not None))
+        positions = dict((value, code) for code, value in
+                         enumerate(categories))
+        #-1 is a missing value, both in codes and in the Categorical. The
+        #extra slot at the end of remap catches codes == -1.
+        remap = np.array([positions.get(value, -1) for value in canonical] +
+                         [-1], dtype=np.int64)
+        return pd.Categorical.from_codes(remap[codes], categories)
+
+    #A copy of frame with each column in `columns` normalized.
+    def normalize_frame(self, frame, columns=("make", "model", "color")):
+        frame = frame.copy()
+        for column in columns:
+            frame[column] = self.normalize_series(frame[column], column)
+        return frame
+
+    #{raw value: canonical value} for one field, for checking the rules.
+    def table(self, field):
+        return dict(self.tables[field])
+
+
+_default = Normalizer()
+
+
+def normalize_frame(frame, columns=("make", "model", "color")):
+    return _default.normalize_frame(frame, columns)
@@ -0,0 +1,99 @@
+import math
+import random
+
+import pandas as pd
+
+from traffic_stream import FILENAME, GOOD_COLUMNS, iter_rows
+
+#Sampling md_traffic.json for exploration
+
+#We don't know the structure of the data up front, so the first thing we do is
+#poke around. Loading every row before we can look at any of them is slow for
+#a big export, and a few thousand rows picked uniformly at random tell us
+#nearly as much.
+
+#sample_rows() keeps a reservoir of n rows while streaming through the file
+#once: every row in the file ends up in the sample with the same probability,
+#without knowing how many rows there are in advance. It uses Li's "Algorithm
+#L", which works out how many rows to skip before the next replacement instead
+#of drawing a random number for every row.
+
+#stratified_sample() keeps a separate reservoir per group (per subagency, per
+#year of the stop, or any function of the row), so small groups aren't
+#drowned out by big ones.
+
+#Both take a seed, so the same seed on the same file gives the same sample.
+
+
+class Reservoir(object):
+
+    def __init__(self, size, rng):
+        self.size = size
+        self.rng = rng
+        self.items = []
+        self.seen = 0
+        self._w = math.exp(math.log(rng.random()) / size) if size else 0.0
+        self._next = size + self._skip()
+
+    def _skip(self):
+        if not self.size:
+            return float("inf")
+        return int(math.floor(math.log(self.rng.random()) /
+                              math.log(1 - self._w)))
+
+    def add(self, item):
+        self.seen += 1
+        if len(self.items) < self.size:
+            self.items.append(item)
+            if len(self.items) == self.size:
+                self._next = self.seen + self._skip() + 1
+            return
+        if self.seen == self._next:
+            self.items[self.rng.randrange(self.size)] = item
+            self._w *= math.exp(math.log(self.rng.random()) / self.size)
+            self._next = self.seen + self._skip() + 1
+
+
+#Year of the stop itself, as opposed to the vehicle's "year" column.
+def stop_year(row, columns=GOOD_COLUMNS):
+    return row[columns.index("date_of_stop")][:4]
+
+
+def _to_frame(rows, columns):
+    return pd.DataFrame(rows, columns=columns)
+
+
+#A uniform random sample of n rows as a DataFrame with `columns`.
+def sample_rows(n, filename=FILENAME, columns=GOOD_COLUMNS, seed=None,
+                column_names=None):
+    reservoir = Reservoir(n, random.Random(seed))
+    for row in iter_rows(filename, columns, column_names):
+        reservoir.add(row)
+    return _to_frame(reservoir.items, columns)
+
+
+#Up to n rows from each group. by is a column name (e.g. "subagency") or a
+#function that takes a row (a list in `columns` order) and returns its group,
+#like stop_year.
+def stratified_sample(n, by="subagency", filename=FILENAME,
+                      columns=GOOD_COLUMNS, seed=None, column_names=None):
+    if callable(by):
+        key = by
+    else:
+        position = columns.index(by)
+        key = lambda row: row[position]
+    reservoirs = {}
+    for row in iter_rows(filename, columns, column_names):
+        group = key(row)
+        reservoir = reservoirs.get(group)
+        if reservoir is None:
+            #Each group gets its own generator seeded from the seed and the
+            #group name, so its sample only depends on that group's rows.
+            rng = random.Random("%s:%s" % (seed, group)
+                                if seed is not None else None)
+            reservoir = Reservoir(n, rng)
+            reservoirs[group] = reservoir
+        reservoir.add(row)
+    rows = [row for group in sorted(reservoirs, key=str)
+            for row in reservoirs[group].items]
+    return _to_frame(rows, columns)
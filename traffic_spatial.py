@@ -0,0 +1,187 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from traffic_stream import FILENAME, iter_batches
+
+#Finding speed traps
+
+#Are speed traps common? Plotting 1000 folium markers of morning_rush gives a
+#feel for it, but answering it means asking "how many stops were there near
+#here" and "where are stops bunched up" over every stop. StopIndex makes
+#those queries fast by putting the stops on a uniform grid of cell_size
+#degree cells:
+
+#  - stops are sorted by grid cell once, and offsets records where each cell's
+#    stops start in that order, so the stops of any run of cells in one grid
+#    row are a single slice
+#  - bbox() and radius() only look at the stops in the cells that overlap the
+#    query, then check the exact coordinates of those
+#  - hotspots() counts the (optionally filtered) stops per cell with one
+#    np.bincount and returns the busiest cells
+
+#Extra columns like description and violation_type are kept as category codes,
+#so filtering millions of stops only tests each distinct value once.
+
+METERS_PER_DEGREE = 111320.0
+
+
+#Latitude/longitude strings to floats. Anything unparseable, and the 0s the
+#export uses for a missing location, become NaN.
+def parse_coordinates(values):
+    coordinates = np.array(pd.to_numeric(pd.Series(values), errors="coerce"),
+                           dtype=np.float64)
+    coordinates[coordinates == 0] = np.nan
+    return coordinates
+
+
+class StopIndex(object):
+
+    #latitude/longitude - arrays of floats, NaN for stops without a location
+    #attributes         - any other per-stop columns, e.g.
+    #                     description=..., violation_type=...
+    def __init__(self, latitude, longitude, cell_size=0.005, **attributes):
+        latitude = np.asarray(latitude, dtype=np.float64)
+        longitude = np.asarray(longitude, dtype=np.float64)
+        located = ~(np.isnan(latitude) | np.isnan(longitude))
+        #Positions in the arrays we were given, so query results can be used
+        #to index the original rows.
+        self.rows = np.flatnonzero(located)
+        self.latitude = latitude[located]
+        self.longitude = longitude[located]
+        self.cell_size = float(cell_size)
+        self.attributes = {}
+        for name, values in attributes.items():
+            codes, categories = pd.factorize(np.asarray(values,
+                                                        dtype=object)[located])
+            self.attributes[name] = (codes, categories)
+
+        if len(self.rows):
+            self.south = self.latitude.min()
+            self.west = self.longitude.min()
+            self.grid_rows = self._grid_row(self.latitude.max()) + 1
+            self.grid_cols = self._grid_col(self.longitude.max()) + 1
+        else:
+            self.south = self.west = 0.0
+            self.grid_rows = self.grid_cols = 0
+        self.cells = (self._grid_row(self.latitude) * self.grid_cols +
+                      self._grid_col(self.longitude))
+        self.order = np.argsort(self.cells, kind="stable")
+        self.offsets = np.zeros(self.grid_rows * self.grid_cols + 1,
+                                dtype=np.int64)
+        np.cumsum(np.bincount(self.cells,
+                              minlength=self.grid_rows * self.grid_cols),
+                  out=self.offsets[1:])
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _grid_row(self, latitude):
+        return np.floor((np.asarray(latitude) - self.south) /
+                        self.cell_size).astype(np.int64)
+
+    def _grid_col(self, longitude):
+        return np.floor((np.asarray(longitude) - self.west) /
+                        self.cell_size).astype(np.int64)
+
+    @classmethod
+    def from_file(cls, filename=FILENAME, cell_size=0.005,
+                  attributes=("description", "violation_type"),
+                  batch_size=100000, column_names=None):
+        columns = ["latitude", "longitude"] + list(attributes)
+        parts = [[] for _ in columns]
+        for batch in iter_batches(filename, columns, batch_size,
+                                  column_names):
+            for part, values in zip(parts, zip(*batch)):
+                part.append(values)
+        joined = [[value for chunk in part for value in chunk]
+                  for part in parts]
+        return cls(parse_coordinates(joined[0]), parse_coordinates(joined[1]),
+                   cell_size, **dict(zip(attributes, joined[2:])))
+
+    #Positions (into self.latitude etc.) of every stop in the cells that
+    #overlap the box. Still needs an exact check on the edges.
+    def _candidates(self, south, west, north, east):
+        if not len(self):
+            return np.empty(0, dtype=np.int64)
+        first_row = max(int(self._grid_row(south)), 0)
+        last_row = min(int(self._grid_row(north)), self.grid_rows - 1)
+        first_col = max(int(self._grid_col(west)), 0)
+        last_col = min(int(self._grid_col(east)), self.grid_cols - 1)
+        if first_row > last_row or first_col > last_col:
+            return np.empty(0, dtype=np.int64)
+        slices = []
+        for row in range(first_row, last_row + 1):
+            start = self.offsets[row * self.grid_cols + first_col]
+            stop = self.offsets[row * self.grid_cols + last_col + 1]
+            if stop > start:
+                slices.append(self.order[start:stop])
+        if not slices:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(slices)
+
+    def _filter(self, positions, filters):
+        for name, wanted in filters.items():
+            codes, categories = self.attributes[name]
+            if callable(wanted):
+                keep = np.array([bool(wanted(value)) for value in categories],
+                                dtype=bool)
+            else:
+                if isinstance(wanted, str):
+                    wanted = [wanted]
+                keep = np.isin(categories, list(wanted))
+            #factorize codes missing values as -1; they never match.
+            keep = np.append(keep, False)
+            positions = positions[keep[codes[positions]]]
+        return positions
+
+    #Row numbers (positions in the arrays the index was built from) of the
+    #stops inside the box, matching filters. A filter is a value, a list of
+    #values, or a function that takes a value and returns True to keep it,
+    #e.g. description=lambda d: "EXCEEDING" in d.
+    def bbox(self, south, west, north, east, **filters):
+        positions = self._candidates(south, west, north, east)
+        latitude = self.latitude[positions]
+        longitude = self.longitude[positions]
+        positions = positions[(latitude >= south) & (latitude <= north) &
+                              (longitude >= west) & (longitude <= east)]
+        return np.sort(self.rows[self._filter(positions, filters)])
+
+    #Row numbers of the stops within meters of (latitude, longitude).
+    def radius(self, latitude, longitude, meters, **filters):
+        lat_span = meters / METERS_PER_DEGREE
+        lon_span = meters / (METERS_PER_DEGREE *
+                             max(math.cos(math.radians(latitude)), 1e-6))
+        positions = self._candidates(latitude - lat_span,
+                                     longitude - lon_span,
+                                     latitude + lat_span,
+                                     longitude + lon_span)
+        positions = self._filter(positions, filters)
+        #Equirectangular distance; plenty accurate at the scale of a county.
+        dy = (self.latitude[positions] - latitude) * METERS_PER_DEGREE
+        dx = ((self.longitude[positions] - longitude) * METERS_PER_DEGREE *
+              np.cos(np.radians((self.latitude[positions] + latitude) / 2)))
+        positions = positions[dx * dx + dy * dy <= meters * meters]
+        return np.sort(self.rows[positions])
+
+    #The n grid cells with the most stops matching filters, busiest first, as
+    #[(count, (south, west, north, east))].
+    def hotspots(self, n=10, **filters):
+        positions = self._filter(np.arange(len(self)), filters)
+        counts = np.bincount(self.cells[positions],
+                             minlength=self.grid_rows * self.grid_cols)
+        n = min(n, int(np.count_nonzero(counts)))
+        if not n:
+            return []
+        top = np.argpartition(-counts, n - 1)[:n]
+        top = top[np.argsort(-counts[top], kind="stable")]
+        hotspots = []
+        for cell in top:
+            row, col = divmod(int(cell), self.grid_cols)
+            south = float(self.south + row * self.cell_size)
+            west = float(self.west + col * self.cell_size)
+            hotspots.append((int(counts[cell]),
+                             (south, west, south + self.cell_size,
+                              west + self.cell_size)))
+        return hotspots
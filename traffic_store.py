@@ -0,0 +1,468 @@
+import math
+import time
+
+import numpy as np
+import pandas as pd
+import requests
+import sqlalchemy as sa
+
+import json_codec
+from traffic_spatial import METERS_PER_DEGREE, parse_coordinates
+from traffic_stream import (FILENAME, GOOD_COLUMNS, iter_batches, iter_rows,
+                            read_column_names)
+
+#A SQLite copy of the traffic stops
+
+#Every analysis in Large_Data_Sets_Python_JSON.py starts by reading all of
+#md_traffic.json into stops and then filters it with boolean masks. TrafficStore
+#loads the good_columns rows into a SQLite table once (through SQLAlchemy,
+#which is already in the Pipfile), along with a few columns worked out at load
+#time:
+
+#stop_date - date_of_stop as YYYY-MM-DD
+#hour      - hour of time_of_stop, 0-23
+#weekday   - day of the week of the stop, Monday is 0
+#cell      - a grid cell number worked out from latitude/longitude
+
+#and indexes stop_date, hour, subagency and cell. Later analyses ask the
+#database for just the rows they need and get a DataFrame back, without
+#re-reading the JSON.
+
+#Keeping it up to date
+
+#md_traffic.json is a snapshot of a Socrata dataset that keeps growing. Every
+#Socrata row carries metadata alongside the data columns: :id, a row id that
+#never changes, and :updated_at, when the row was last added or changed. The
+#store keeps both for every row (as row_id and updated_at, with a unique
+#index on row_id) and remembers the newest :updated_at it has loaded as its
+#high-water mark. Then:
+
+#ingest(filename)  - streams a newer snapshot and only does any work for rows
+#                    updated at or after the mark. The rest are skipped as
+#                    soon as their metadata has been read.
+#ingest_api()      - asks the Socrata API for just the rows updated since the
+#                    mark, page by page, so nothing old is even downloaded.
+
+#Rows are written with INSERT OR REPLACE on row_id, so a changed row replaces
+#its old copy, and rows that share the mark's timestamp can safely be seen
+#twice.
+
+DEFAULT_URL = "sqlite:///md_traffic.db"
+
+SODA_URL = "https://data.montgomerycountymd.gov/resource/4mse-ku6q.json"
+
+META_COLUMNS = ["row_id", "updated_at"]
+
+#Derived columns and the indexes on them.
+DERIVED_COLUMNS = ["stop_date", "hour", "weekday", "cell"]
+INDEXES = {
+    "ix_stops_stop_date": ["stop_date"],
+    "ix_stops_hour": ["hour", "weekday"],
+    "ix_stops_subagency": ["subagency", "stop_date"],
+    "ix_stops_cell": ["cell"],
+}
+
+_FLOAT_COLUMNS = ("latitude", "longitude")
+_INTEGER_COLUMNS = ("updated_at", "hour", "weekday", "cell")
+
+
+#:updated_at is seconds since the epoch in the JSON export and an ISO
+#timestamp from the API.
+def _epoch(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    value = str(value)
+    if value.isdigit():
+        return int(value)
+    return int(pd.Timestamp(value).timestamp())
+
+
+#The export's names for the row id and last-updated columns.
+def meta_columns(column_names):
+    row_id = next((name for name in (":id", ":sid") if name in column_names),
+                  None)
+    updated = next((name for name in (":updated_at", ":created_at")
+                    if name in column_names), None)
+    if row_id is None or updated is None:
+        raise ValueError("no Socrata row metadata (:id, :updated_at) in the "
+                         "columns")
+    return [row_id, updated]
+
+
+class TrafficStore(object):
+
+    #cell_size is the size of a grid cell in degrees. Cells are numbered over
+    #the whole globe so the numbering doesn't depend on what's been loaded.
+    def __init__(self, url=DEFAULT_URL, cell_size=0.005, engine=None):
+        self.engine = engine if engine is not None else sa.create_engine(url)
+        self.cell_size = float(cell_size)
+        self._grid_cols = int(math.ceil(360.0 / self.cell_size))
+        self.metadata = sa.MetaData()
+        self.columns = META_COLUMNS + GOOD_COLUMNS + DERIVED_COLUMNS
+        columns = []
+        for name in self.columns:
+            if name in _FLOAT_COLUMNS:
+                kind = sa.Float
+            elif name in _INTEGER_COLUMNS:
+                kind = sa.Integer
+            else:
+                kind = sa.Text
+            columns.append(sa.Column(name, kind))
+        self.stops = sa.Table("stops", self.metadata, *columns)
+        self.ingest_state = sa.Table(
+            "ingest_state", self.metadata,
+            sa.Column("name", sa.Text, primary_key=True),
+            sa.Column("updated_at", sa.Integer))
+        self.metadata.create_all(self.engine)
+        with self.engine.begin() as connection:
+            #Stores made before row metadata was kept don't have the columns.
+            #Their rows get a NULL row_id and are replaced wholesale by the
+            #next load() (see there).
+            existing = [row[1] for row in connection.execute(
+                sa.text("PRAGMA table_info(stops)"))]
+            for name in META_COLUMNS:
+                if name not in existing:
+                    connection.execute(sa.text(
+                        "ALTER TABLE stops ADD COLUMN %s %s" % (
+                            name, "INTEGER" if name in _INTEGER_COLUMNS
+                            else "TEXT")))
+            connection.execute(sa.text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS ix_stops_row_id "
+                "ON stops (row_id)"))
+
+    def _cell(self, latitude, longitude):
+        row = np.floor((latitude + 90) / self.cell_size)
+        col = np.floor((longitude + 180) / self.cell_size)
+        return row * self._grid_cols + col
+
+    #Rows in GOOD_COLUMNS order to a DataFrame with the derived columns added.
+    #meta is a (row_id, updated_at) pair per row, if we have them.
+    def _frame(self, rows, meta=None):
+        frame = pd.DataFrame(rows, columns=GOOD_COLUMNS)
+        if meta is None:
+            frame["row_id"] = None
+            frame["updated_at"] = None
+        else:
+            frame["row_id"] = [row_id for row_id, _ in meta]
+            frame["updated_at"] = pd.to_numeric(
+                [updated for _, updated in meta])
+        frame["latitude"] = parse_coordinates(frame["latitude"])
+        frame["longitude"] = parse_coordinates(frame["longitude"])
+        dates = pd.to_datetime(frame["date_of_stop"].str[:10],
+                               format="%Y-%m-%d", errors="coerce")
+        frame["stop_date"] = dates.dt.strftime("%Y-%m-%d")
+        frame["weekday"] = dates.dt.weekday
+        frame["hour"] = pd.to_numeric(frame["time_of_stop"].str[:2],
+                                      errors="coerce")
+        frame["cell"] = self._cell(frame["latitude"], frame["longitude"])
+        return frame
+
+    #Rows as tuples in self.columns order. sqlite3 wants None rather than
+    #NaN, and plain ints rather than floats for the integer columns (which
+    #pandas turns into floats as soon as one is missing).
+    def _tuples(self, frame):
+        values = []
+        for name in self.columns:
+            column = np.array(frame[name], dtype=object)
+            missing = frame[name].isna().to_numpy()
+            if name in _INTEGER_COLUMNS:
+                column = [None if gap else int(value)
+                          for value, gap in zip(column, missing)]
+            else:
+                column[missing] = None
+            values.append(column)
+        return list(zip(*values))
+
+    #Add rows (lists in GOOD_COLUMNS order), replacing any stored row with the
+    #same row id. Returns how many were written.
+    #The insert goes straight to the DB-API executemany; building a dict per
+    #row for SQLAlchemy's insert() costs more than the insert itself.
+    def insert_rows(self, rows, connection=None, meta=None):
+        if not len(rows):
+            return 0
+        tuples = self._tuples(self._frame(rows, meta))
+        if connection is None:
+            with self.engine.begin() as connection:
+                self._insert(connection, tuples)
+        else:
+            self._insert(connection, tuples)
+        return len(tuples)
+
+    def _insert(self, connection, tuples):
+        marker = "?" if self.engine.dialect.paramstyle == "qmark" else "%s"
+        sql = "INSERT OR REPLACE INTO stops (%s) VALUES (%s)" % (
+            ", ".join(self.columns), ", ".join([marker] * len(self.columns)))
+        cursor = connection.connection.cursor()
+        try:
+            cursor.executemany(sql, tuples)
+        finally:
+            cursor.close()
+
+    def create_indexes(self, connection=None):
+        statements = ["CREATE INDEX IF NOT EXISTS %s ON stops (%s)" % (
+            name, ", ".join(columns)) for name, columns in INDEXES.items()]
+        statements.append("ANALYZE stops")
+        if connection is None:
+            with self.engine.begin() as connection:
+                for statement in statements:
+                    connection.execute(sa.text(statement))
+        else:
+            for statement in statements:
+                connection.execute(sa.text(statement))
+
+    def high_water_mark(self):
+        with self.engine.connect() as connection:
+            return connection.execute(sa.text(
+                "SELECT updated_at FROM ingest_state WHERE name = 'stops'")
+            ).scalar()
+
+    def _set_mark(self, connection, updated_at):
+        connection.execute(sa.text(
+            "INSERT OR REPLACE INTO ingest_state (name, updated_at) "
+            "VALUES ('stops', :updated_at)"), {"updated_at": updated_at})
+
+    #Batches of (rows, meta) from the file. Files without row metadata give
+    #meta=None.
+    def _file_batches(self, filename, batch_size, column_names, mark=None):
+        if column_names is None:
+            column_names = read_column_names(filename)
+        try:
+            meta = meta_columns(column_names)
+        except ValueError:
+            if mark is not None:
+                raise
+            for batch in iter_batches(filename, GOOD_COLUMNS, batch_size,
+                                      column_names):
+                yield batch, None
+            return
+        rows, pairs = [], []
+        for row in iter_rows(filename, meta + GOOD_COLUMNS, column_names):
+            updated = _epoch(row[1])
+            #Rows without a timestamp can't be compared with the mark, so
+            #they're always (re)applied.
+            if mark is not None and updated is not None and updated < mark:
+                continue
+            rows.append(row[2:])
+            pairs.append((row[0], updated))
+            if len(rows) >= batch_size:
+                yield rows, pairs
+                rows, pairs = [], []
+        if rows:
+            yield rows, pairs
+
+    @staticmethod
+    def _newest(mark, meta):
+        stamps = [updated for _, updated in meta or () if updated is not None]
+        if stamps and (mark is None or max(stamps) > mark):
+            return max(stamps)
+        return mark
+
+    #Stream md_traffic.json into the table in batches, then build the indexes.
+    #Building indexes after a bulk load is much faster than keeping them up
+    #to date row by row. Returns how many rows were written.
+
+    #Only rows with a row id can be replaced, so:
+    #- rows stored without one (by a store made before row metadata was kept)
+    #  are deleted before a file that has row ids is loaded over them, since
+    #  the file has them all again;
+    #- a file without row ids is only loaded into an empty table. Loading it
+    #  again would add every row a second time.
+    def load(self, filename=FILENAME, batch_size=100000, column_names=None):
+        if column_names is None:
+            column_names = read_column_names(filename)
+        try:
+            meta_columns(column_names)
+            has_meta = True
+        except ValueError:
+            has_meta = False
+        written = 0
+        mark = self.high_water_mark()
+        with self.engine.begin() as connection:
+            if has_meta:
+                connection.execute(sa.text(
+                    "DELETE FROM stops WHERE row_id IS NULL"))
+            elif connection.execute(sa.text(
+                    "SELECT 1 FROM stops LIMIT 1")).first() is not None:
+                raise ValueError("%s has no row ids (:id, :updated_at), so it "
+                                 "can only be loaded into an empty store" %
+                                 filename)
+            for name in INDEXES:
+                connection.execute(sa.text("DROP INDEX IF EXISTS %s" % name))
+            for rows, meta in self._file_batches(filename, batch_size,
+                                                 column_names):
+                written += self.insert_rows(rows, connection, meta)
+                mark = self._newest(mark, meta)
+            if mark is not None:
+                self._set_mark(connection, mark)
+            self.create_indexes(connection)
+        return written
+
+    #Add only the rows of a newer snapshot that were updated since the last
+    #load or ingest. An empty store gets a full load. Returns how many rows
+    #were written.
+    def ingest(self, filename=FILENAME, batch_size=100000, column_names=None):
+        mark = self.high_water_mark()
+        if mark is None:
+            return self.load(filename, batch_size, column_names)
+        written = 0
+        newest = mark
+        with self.engine.begin() as connection:
+            for rows, meta in self._file_batches(filename, batch_size,
+                                                 column_names, mark):
+                written += self.insert_rows(rows, connection, meta)
+                newest = self._newest(newest, meta)
+            self._set_mark(connection, newest)
+        return written
+
+    #Pull the rows updated since the mark straight from the Socrata API, in
+    #:updated_at order. Each page is committed together with the new mark,
+    #so an interrupted ingest picks up where it stopped.
+    def ingest_api(self, url=SODA_URL, page_size=50000, session=None,
+                   timeout=60):
+        session = session or requests.Session()
+        mark = self.high_water_mark()
+        params = {"$select": ", ".join([":id", ":updated_at"] + GOOD_COLUMNS),
+                  "$order": ":updated_at, :id",
+                  "$limit": page_size}
+        if mark is not None:
+            params["$where"] = ":updated_at >= '%s'" % time.strftime(
+                "%Y-%m-%dT%H:%M:%S", time.gmtime(mark))
+        written = 0
+        offset = 0
+        while True:
+            params["$offset"] = offset
+            response = session.get(url, params=params, timeout=timeout)
+            response.raise_for_status()
+            records = json_codec.decode_response(response)
+            if not records:
+                break
+            rows = [[record.get(column) for column in GOOD_COLUMNS]
+                    for record in records]
+            meta = [(record.get(":id"), _epoch(record.get(":updated_at")))
+                    for record in records]
+            mark = self._newest(mark, meta)
+            with self.engine.begin() as connection:
+                written += self.insert_rows(rows, connection, meta)
+                if mark is not None:
+                    self._set_mark(connection, mark)
+            if len(records) < page_size:
+                break
+            offset += len(records)
+        return written
+
+    def __len__(self):
+        with self.engine.connect() as connection:
+            return connection.execute(
+                sa.text("SELECT COUNT(*) FROM stops")).scalar()
+
+    #Any SQL against the stops table, as a DataFrame.
+    def query(self, sql, **params):
+        with self.engine.connect() as connection:
+            return pd.read_sql(sa.text(sql), connection, params=params)
+
+    def _in(self, column, values, params):
+        if isinstance(values, (str, int)):
+            values = [values]
+        names = []
+        for value in values:
+            name = "p%d" % len(params)
+            params[name] = value
+            names.append(":" + name)
+        return "%s IN (%s)" % (column, ", ".join(names) or "NULL")
+
+    #WHERE clause for the filters shared by select() and counts().
+    def _where(self, start=None, end=None, hours=None, weekdays=None,
+               subagencies=None, violation_types=None, box=None):
+        clauses = []
+        params = {}
+        if start is not None:
+            clauses.append("stop_date >= :start")
+            params["start"] = str(start)[:10]
+        if end is not None:
+            clauses.append("stop_date < :end")
+            params["end"] = str(end)[:10]
+        if hours is not None:
+            clauses.append(self._in("hour", hours, params))
+        if weekdays is not None:
+            clauses.append(self._in("weekday", weekdays, params))
+        if subagencies is not None:
+            clauses.append(self._in("subagency", subagencies, params))
+        if violation_types is not None:
+            clauses.append(self._in("violation_type", violation_types,
+                                    params))
+        if box is not None:
+            clauses.append(self._box(box, params))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    #The cells covering a box make one range of cell numbers per grid row,
+    #which the cell index can answer directly; the exact coordinates are
+    #checked after that.
+    def _box(self, box, params):
+        south, west, north, east = box
+        first_row = int(math.floor((south + 90) / self.cell_size))
+        last_row = int(math.floor((north + 90) / self.cell_size))
+        first_col = int(math.floor((west + 180) / self.cell_size))
+        last_col = int(math.floor((east + 180) / self.cell_size))
+        ranges = []
+        for row in range(first_row, last_row + 1):
+            low = "p%d" % len(params)
+            params[low] = row * self._grid_cols + first_col
+            high = "p%d" % len(params)
+            params[high] = row * self._grid_cols + last_col
+            ranges.append("cell BETWEEN :%s AND :%s" % (low, high))
+        for name, value in zip(("south", "west", "north", "east"), box):
+            params[name] = value
+        return ("(%s) AND latitude BETWEEN :south AND :north AND longitude "
+                "BETWEEN :west AND :east" % " OR ".join(ranges or ["0"]))
+
+    def _columns(self, columns):
+        columns = self.columns if columns is None else list(columns)
+        for column in columns:
+            if column not in self.columns:
+                raise ValueError("stops has no column %s" % column)
+        return columns
+
+    #Stops matching the filters, as a DataFrame.
+    #start/end       - dates (strings or datetimes), end is exclusive
+    #hours/weekdays  - a number or a list of numbers
+    #subagencies,
+    #violation_types - a value or a list of values
+    #box             - (south, west, north, east)
+    def select(self, columns=None, limit=None, **filters):
+        where, params = self._where(**filters)
+        sql = "SELECT %s FROM stops%s" % (", ".join(self._columns(columns)),
+                                          where)
+        if limit is not None:
+            sql += " LIMIT %d" % int(limit)
+        return self.query(sql, **params)
+
+    #Stops within meters of a point. Uses the box around the circle and then
+    #checks the distance in pandas.
+    def near(self, latitude, longitude, meters, columns=None, **filters):
+        lat_span = meters / METERS_PER_DEGREE
+        lon_span = meters / (METERS_PER_DEGREE *
+                             max(math.cos(math.radians(latitude)), 1e-6))
+        columns = self._columns(columns)
+        needed = columns + [c for c in _FLOAT_COLUMNS if c not in columns]
+        frame = self.select(needed, box=(latitude - lat_span,
+                                         longitude - lon_span,
+                                         latitude + lat_span,
+                                         longitude + lon_span), **filters)
+        dy = (frame["latitude"] - latitude) * METERS_PER_DEGREE
+        dx = ((frame["longitude"] - longitude) * METERS_PER_DEGREE *
+              np.cos(np.radians((frame["latitude"] + latitude) / 2)))
+        return frame.loc[dx * dx + dy * dy <= meters * meters,
+                         columns].reset_index(drop=True)
+
+    #Number of stops per value of `by` (a column name or a list of them),
+    #most first.
+    def counts(self, by, **filters):
+        by = self._columns([by] if isinstance(by, str) else by)
+        where, params = self._where(**filters)
+        group = ", ".join(by)
+        return self.query("SELECT %s, COUNT(*) AS stops FROM stops%s "
+                          "GROUP BY %s ORDER BY stops DESC" % (group, where,
+                                                               group),
+                          **params)
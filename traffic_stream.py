@@ -0,0 +1,67 @@
+import ijson
+
+#Streaming rows out of md_traffic.json
+
+#Large_Data_Sets_Python_JSON.py reads the column names from meta.view.columns
+#and then walks data.item with ijson, picking out the good_columns fields of
+#every row. The analysis modules (traffic_sketches, traffic_sampling,
+#traffic_cube, ...) all start from that same stream, so it lives here.
+
+#Looking up column_names.index(item) for every field of every row searches the
+#whole column list each time. We work the positions out once up front and
+#then just index each row.
+
+FILENAME = "md_traffic.json"
+
+GOOD_COLUMNS = [
+    "date_of_stop",
+    "time_of_stop",
+    "agency",
+    "subagency",
+    "description",
+    "location",
+    "latitude",
+    "longitude",
+    "vehicle_type",
+    "year",
+    "make",
+    "model",
+    "color",
+    "violation_type",
+    "race",
+    "gender",
+    "driver_state",
+    "driver_city",
+    "dl_state",
+    "arrest_type"]
+
+
+def read_column_names(filename=FILENAME):
+    with open(filename, "rb") as f:
+        return [column["fieldName"]
+                for column in ijson.items(f, "meta.view.columns.item")]
+
+
+#Yield each row of the data section as a list holding just `columns`, in that
+#order. column_names can be passed in to skip re-reading the metadata.
+def iter_rows(filename=FILENAME, columns=GOOD_COLUMNS, column_names=None):
+    if column_names is None:
+        column_names = read_column_names(filename)
+    positions = [column_names.index(column) for column in columns]
+    with open(filename, "rb") as f:
+        for row in ijson.items(f, "data.item"):
+            yield [row[position] for position in positions]
+
+
+#Same rows, but as lists of up to batch_size rows at a time, which is handier
+#for anything that works on numpy arrays or DataFrames.
+def iter_batches(filename=FILENAME, columns=GOOD_COLUMNS, batch_size=100000,
+                 column_names=None):
+    batch = []
+    for row in iter_rows(filename, columns, column_names):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,117 @@
+import queue
+import threading
+
+import tweepy
+
+#Paging through timelines, followers and blocks
+
+#api.home_timeline(), user.followers() and api.blocks() each return a single
+#page: the last 20 tweets, the last 20 followers and so on. tweepy.Cursor knows
+#how to ask for the next page (max_id for timelines, cursor for follower and
+#block lists), so here we wrap it in generators that hand back one item at a
+#time and only request a page when we get to it.
+
+#With prefetch turned on, a background thread requests page N+1 while we're
+#still working through page N, so the time spent waiting on Twitter overlaps
+#with the time spent processing. prefetch is how many pages may be fetched
+#ahead; the thread blocks once it's that far ahead of us.
+
+#Everything takes the api object and an optional cursor argument. cursor
+#defaults to tweepy.Cursor; passing something else is how we swap in a fake
+#for testing without talking to Twitter.
+
+_END = object()
+
+
+#Pull pages from an iterator on a background thread. Closing the generator
+#(or just dropping it) tells the thread to stop after the page it's on.
+def _prefetched(pages, prefetch):
+    buffer = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for page in pages:
+                if not put(("page", page)):
+                    return
+            put(("end", _END))
+        except Exception as error:
+            put(("error", error))
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            kind, value = buffer.get()
+            if kind == "error":
+                raise value
+            if kind == "end":
+                return
+            yield value
+    finally:
+        stop.set()
+
+
+#Yield whole pages from an API method, e.g. iter_pages(api.home_timeline).
+def iter_pages(method, prefetch=1, limit=None, cursor=None, **kwargs):
+    cursor = cursor or tweepy.Cursor
+    #tweepy 3 treats pages(0) as "no limit" but tweepy 4 uses infinity as the
+    #default, so only pass a limit when we actually have one.
+    if limit:
+        pages = cursor(method, **kwargs).pages(limit)
+    else:
+        pages = cursor(method, **kwargs).pages()
+    if not prefetch:
+        return iter(pages)
+    return _prefetched(pages, prefetch)
+
+
+#Yield the items of every page one at a time. limit caps the number of items.
+def iter_items(method, limit=None, prefetch=1, cursor=None, **kwargs):
+    count = 0
+    pages = iter_pages(method, prefetch=prefetch, cursor=cursor, **kwargs)
+    try:
+        for page in pages:
+            for item in page:
+                if limit is not None and count >= limit:
+                    return
+                yield item
+                count += 1
+    finally:
+        if hasattr(pages, "close"):
+            pages.close()
+
+
+#tweepy 4 renamed followers() and blocks() to get_followers() and
+#get_blocks(). Use whichever one this version of tweepy has.
+def _method(api, *names):
+    for name in names:
+        if hasattr(api, name):
+            return getattr(api, name)
+    raise AttributeError("api has none of %s" % ", ".join(names))
+
+
+def home_timeline(api, limit=None, prefetch=1, count=200, **kwargs):
+    return iter_items(api.home_timeline, limit=limit, prefetch=prefetch,
+                      count=count, **kwargs)
+
+
+def followers(api, screen_name, limit=None, prefetch=1, count=200, **kwargs):
+    return iter_items(_method(api, "get_followers", "followers"),
+                      limit=limit, prefetch=prefetch,
+                      screen_name=screen_name, count=count, **kwargs)
+
+
+def blocks(api, limit=None, prefetch=1, **kwargs):
+    return iter_items(_method(api, "get_blocks", "blocks"), limit=limit,
+                      prefetch=prefetch, **kwargs)
@@ -0,0 +1,285 @@
+import collections
+import concurrent.futures
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+
+import api_http
+from token_bucket import TokenBucket
+
+#Queueing the bot's likes, follows and profile updates
+
+#api.create_favorite(), api.create_friendship() and api.update_profile() are
+#called inline, one at a time, and nothing remembers that they happened. Run
+#the bot again and it happily likes the same tweet and follows the same
+#account, spending write quota on calls Twitter ignores.
+
+#ActionQueue sits in front of those calls:
+
+#- Every action has a key like "favorite:1234". Keys that already went through
+#  are remembered in a Bloom filter, a fixed-size bit array that answers "have
+#  we done this?" using about 10 bits per key instead of a Python set of
+#  strings. It can very rarely say yes to something new (the false positive
+#  rate is set by error_rate), but never forgets something it has seen.
+#- Pending actions are appended to a journal file as they're queued and marked
+#  done as they finish, so a restart picks up where the last run stopped.
+#- A small thread pool sends the actions, and each kind of action has its own
+#  token bucket so we stay under Twitter's write limits. The buckets are saved
+#  with the rest of the state, so restarting doesn't hand out a fresh budget.
+#- Profile updates are collapsed, since only the most recent one matters.
+
+#Twitter errors meaning "you already did this", by kind of action: 139 is
+#already favorited and 160 is a follow request already pending. Following
+#someone we already follow isn't an error at all.
+ALREADY_DONE_CODES = {
+    "favorite": frozenset([139]),
+    "follow": frozenset([160]),
+}
+
+#The endpoint each kind of action calls, for labelling retries.
+TWITTER_API_URL = "https://api.twitter.com/1.1/"
+ACTION_URLS = {
+    "favorite": TWITTER_API_URL + "favorites/create.json",
+    "follow": TWITTER_API_URL + "friendships/create.json",
+    "update_profile": TWITTER_API_URL + "account/update_profile.json",
+}
+
+#Default per-action write budgets as (calls, per seconds).
+DEFAULT_RATES = {
+    "favorite": (1000, 24 * 60 * 60),
+    "follow": (400, 24 * 60 * 60),
+    "update_profile": (15, 15 * 60),
+}
+
+
+class BloomFilter(object):
+
+    def __init__(self, capacity=1000000, error_rate=0.001, bits=None):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = int(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray(bits) if bits is not None else bytearray(
+            (self.size + 7) // 8)
+
+    #Double hashing: two 64 bit halves of one digest give us every probe.
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(key))
+
+    def save(self, path):
+        header = json.dumps({"capacity": self.capacity,
+                             "error_rate": self.error_rate}).encode("utf-8")
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(header + b"\n")
+            f.write(self.bits)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            header = json.loads(f.readline().decode("utf-8"))
+            return cls(header["capacity"], header["error_rate"], f.read())
+
+
+Action = collections.namedtuple("Action", ["kind", "target", "kwargs"])
+
+
+def action_key(action):
+    if action.kind == "update_profile":
+        #Only the latest profile update matters, so they all share one key
+        #while pending; the seen filter uses the content instead.
+        return "update_profile"
+    return "%s:%s" % (action.kind, action.target)
+
+
+def _seen_key(action):
+    if action.kind == "update_profile":
+        return "update_profile:" + json.dumps(action.kwargs, sort_keys=True)
+    return action_key(action)
+
+
+class ActionQueue(object):
+
+    #api       - a tweepy API object.
+    #state_dir - where the journal, the seen filter and the buckets live.
+    #rates     - {kind: (calls, per seconds)} overriding DEFAULT_RATES.
+    def __init__(self, api, state_dir="bot_state", workers=4, rates=None,
+                 capacity=1000000, error_rate=0.001, max_attempts=3):
+        self.api = api
+        self.state_dir = state_dir
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.skipped = 0
+        self.sent = 0
+        self.failed = 0
+        budgets = dict(DEFAULT_RATES)
+        budgets.update(rates or {})
+        self.buckets = dict((kind, TokenBucket(*budget))
+                            for kind, budget in budgets.items())
+
+        os.makedirs(state_dir, exist_ok=True)
+        self._seen_path = os.path.join(state_dir, "seen.bloom")
+        self._journal_path = os.path.join(state_dir, "pending.jsonl")
+        self._buckets_path = os.path.join(state_dir, "buckets.json")
+        self._load_buckets()
+        if os.path.exists(self._seen_path):
+            self.seen = BloomFilter.load(self._seen_path)
+        else:
+            self.seen = BloomFilter(capacity, error_rate)
+        self._lock = threading.Lock()
+        self._pending = collections.OrderedDict()
+        self._recover()
+        self._journal = open(self._journal_path, "a")
+
+    #Replay the journal from the last run and rewrite it with just the
+    #actions that never finished.
+    def _recover(self):
+        if os.path.exists(self._journal_path):
+            with open(self._journal_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        #A half written last line from a crash.
+                        continue
+                    if entry["op"] == "add":
+                        action = Action(entry["kind"], entry["target"],
+                                        entry["kwargs"])
+                        self._pending[action_key(action)] = action
+                    else:
+                        self._pending.pop(entry["key"], None)
+        tmp = self._journal_path + ".tmp"
+        with open(tmp, "w") as f:
+            for action in self._pending.values():
+                f.write(self._journal_line("add", action))
+        os.replace(tmp, self._journal_path)
+
+    def _load_buckets(self):
+        if not os.path.exists(self._buckets_path):
+            return
+        try:
+            with open(self._buckets_path) as f:
+                saved = json.load(f)
+        except ValueError:
+            return
+        for kind, (tokens, updated) in saved.items():
+            if kind in self.buckets:
+                self.buckets[kind].restore(tokens, updated)
+
+    def _save_buckets(self):
+        saved = dict((kind, bucket.state())
+                     for kind, bucket in self.buckets.items())
+        tmp = self._buckets_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(saved, f)
+        os.replace(tmp, self._buckets_path)
+
+    def _journal_line(self, op, action):
+        if op == "add":
+            entry = {"op": "add", "kind": action.kind,
+                     "target": action.target, "kwargs": action.kwargs}
+        else:
+            entry = {"op": "done", "key": action_key(action)}
+        return json.dumps(entry) + "\n"
+
+    def _write(self, op, action):
+        self._journal.write(self._journal_line(op, action))
+        self._journal.flush()
+
+    #Returns False when the action was dropped as a repeat.
+    def add(self, kind, target=None, **kwargs):
+        action = Action(kind, target, kwargs)
+        key = action_key(action)
+        with self._lock:
+            if _seen_key(action) in self.seen:
+                self.skipped += 1
+                return False
+            if key in self._pending and kind != "update_profile":
+                self.skipped += 1
+                return False
+            self._pending[key] = action
+            self._write("add", action)
+        return True
+
+    def like(self, tweet_id):
+        return self.add("favorite", int(tweet_id))
+
+    def follow(self, screen_name):
+        return self.add("follow", screen_name)
+
+    def update_profile(self, **fields):
+        return self.add("update_profile", None, **fields)
+
+    def pending(self):
+        return list(self._pending.values())
+
+    def _send(self, action):
+        bucket = self.buckets.get(action.kind)
+        if bucket is not None:
+            bucket.acquire()
+        if action.kind == "favorite":
+            self.api.create_favorite(action.target)
+        elif action.kind == "follow":
+            self.api.create_friendship(screen_name=action.target)
+        elif action.kind == "update_profile":
+            self.api.update_profile(**action.kwargs)
+        else:
+            raise ValueError("unknown action: %s" % action.kind)
+
+    def _attempt(self, action):
+        for attempt in range(self.max_attempts):
+            try:
+                self._send(action)
+                return True
+            except Exception as error:
+                codes = set(getattr(error, "api_codes", None) or [])
+                if codes & ALREADY_DONE_CODES.get(action.kind, frozenset()):
+                    return True
+                if attempt + 1 == self.max_attempts:
+                    return False
+                api_http.note_retry(ACTION_URLS.get(action.kind, action.kind),
+                                    "api_error")
+                time.sleep(2 ** attempt)
+
+    def _finish(self, action, ok):
+        with self._lock:
+            if ok:
+                self.seen.add(_seen_key(action))
+                self.sent += 1
+                if self._pending.get(action_key(action)) == action:
+                    del self._pending[action_key(action)]
+                    self._write("done", action)
+            else:
+                #Leave it in the journal so the next run tries again.
+                self.failed += 1
+
+    #Send everything that's pending and return (sent, skipped, failed).
+    def run(self):
+        actions = list(self._pending.values())
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+            results = pool.map(self._attempt, actions)
+            for action, ok in zip(actions, results):
+                self._finish(action, ok)
+        self.seen.save(self._seen_path)
+        self._save_buckets()
+        return self.sent, self.skipped, self.failed
+
+    def close(self):
+        self.seen.save(self._seen_path)
+        self._save_buckets()
+        self._journal.close()
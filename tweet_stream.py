@@ -0,0 +1,239 @@
+import asyncio
+import calendar
+import random
+import threading
+import time
+
+import requests
+
+import api_http
+import json_codec
+
+#Streaming tweets instead of polling
+
+#The bot finds a tweet to like by calling api.home_timeline(count=1). Polling
+#like that uses up the timeline budget whether or not anything new happened,
+#and a new tweet can sit unnoticed until the next poll comes around.
+
+#StreamIngestor connects to a streaming endpoint instead: one long HTTP
+#response where the server writes one JSON object per line as things happen.
+#A reader thread pulls lines off the connection and puts the decoded events on
+#a bounded asyncio queue, and a few async workers take them off and pass each
+#one to the handler for its kind ("tweet", "favorite", "follow", ...).
+
+#- If the handlers fall behind, the queue fills up and the reader stops
+#  reading, so the backlog waits in the socket buffer instead of in memory.
+#- If the connection drops, the reader reconnects with exponential backoff
+#  (plus a little jitter), and the backoff resets once a connection works.
+#  A malformed line is only counted (stats.bad_lines) and skipped.
+#- For every event we record how long it took from arriving on the socket to
+#  its handler finishing, and from when Twitter created it to when we finished
+#  with it, so we can see where latency comes from.
+
+#Handlers can be plain functions or coroutines. Plain functions run in the
+#default executor so a slow tweepy call doesn't stall the event loop.
+
+
+#Kind of a stream message: user stream events carry an "event" key, plain
+#tweets have "text", and anything else is filed under its first key.
+def event_kind(event):
+    if "event" in event:
+        return event["event"]
+    if "text" in event or "full_text" in event:
+        return "tweet"
+    if "delete" in event:
+        return "delete"
+    return next(iter(event), "unknown")
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class LatencyStats(object):
+
+    #window is how many recent events the percentiles are computed over.
+    def __init__(self, window=10000):
+        self.window = window
+        self.count = 0
+        self.errors = 0
+        self.reconnects = 0
+        self.bad_lines = 0
+        self._handling = []
+        self._end_to_end = []
+        self._lock = threading.Lock()
+
+    def record(self, handling, end_to_end=None):
+        with self._lock:
+            self.count += 1
+            self._handling.append(handling)
+            del self._handling[:-self.window]
+            if end_to_end is not None:
+                self._end_to_end.append(end_to_end)
+                del self._end_to_end[:-self.window]
+
+    def summary(self):
+        with self._lock:
+            handling = sorted(self._handling)
+            end_to_end = sorted(self._end_to_end)
+        summary = {"events": self.count, "errors": self.errors,
+                   "reconnects": self.reconnects,
+                   "bad_lines": self.bad_lines}
+        for name, values in (("handling", handling),
+                             ("end_to_end", end_to_end)):
+            for label, fraction in (("p50", 0.5), ("p95", 0.95),
+                                    ("p99", 0.99)):
+                summary["%s_%s" % (name, label)] = _percentile(values,
+                                                                fraction)
+        return summary
+
+
+#Twitter puts a millisecond timestamp on streamed tweets; fall back to the
+#created_at string when it isn't there.
+def _created_time(event):
+    if "timestamp_ms" in event:
+        return int(event["timestamp_ms"]) / 1000.0
+    created_at = event.get("created_at")
+    if created_at:
+        try:
+            return calendar.timegm(time.strptime(
+                created_at, "%a %b %d %H:%M:%S +0000 %Y"))
+        except ValueError:
+            return None
+    return None
+
+
+class StreamIngestor(object):
+
+    #url       - the streaming endpoint.
+    #handlers  - {kind: function(event)}; "*" catches every kind.
+    #auth      - anything requests accepts as auth, e.g. an OAuth1 object.
+    def __init__(self, url, handlers, auth=None, params=None, queue_size=1000,
+                 workers=4, session=None, min_backoff=1.0, max_backoff=60.0,
+                 read_timeout=90):
+        self.url = url
+        self.handlers = dict(handlers)
+        self.auth = auth
+        self.params = params
+        self.queue_size = queue_size
+        self.workers = workers
+        self.session = session or requests.Session()
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.read_timeout = read_timeout
+        self.stats = LatencyStats()
+        self.events_seen = 0
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    #Runs on its own thread. Each decoded line is handed to the event loop with
+    #run_coroutine_threadsafe and we wait for the put to finish, which is what
+    #makes a full queue push back on the connection.
+    def _read(self, loop, queue):
+        backoff = self.min_backoff
+        while not self._stop.is_set():
+            try:
+                with self.session.get(self.url, params=self.params,
+                                      auth=self.auth, stream=True,
+                                      timeout=(10, self.read_timeout)) as r:
+                    r.raise_for_status()
+                    backoff = self.min_backoff
+                    for line in r.iter_lines():
+                        if self._stop.is_set():
+                            break
+                        #Blank lines are keep-alives.
+                        if not line:
+                            continue
+                        #A line that isn't valid JSON is counted and
+                        #skipped; it's no reason to drop the connection.
+                        try:
+                            event = json_codec.loads(line)
+                        except ValueError:
+                            self.stats.bad_lines += 1
+                            continue
+                        asyncio.run_coroutine_threadsafe(
+                            queue.put((time.time(), event)), loop).result()
+            except (requests.RequestException, ValueError):
+                self.stats.errors += 1
+            if self._stop.is_set():
+                break
+            self.stats.reconnects += 1
+            api_http.note_retry(self.url, "reconnect")
+            self._stop.wait(backoff * (1 + random.random() * 0.25))
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def _handle(self, loop, received, event):
+        self.events_seen += 1
+        kind = event_kind(event)
+        handler = self.handlers.get(kind) or self.handlers.get("*")
+        if handler is None:
+            return
+        try:
+            if asyncio.iscoroutinefunction(handler):
+                await handler(event)
+            else:
+                await loop.run_in_executor(None, handler, event)
+        except Exception:
+            self.stats.errors += 1
+            return
+        finished = time.time()
+        created = _created_time(event)
+        self.stats.record(finished - received,
+                          finished - created if created else None)
+
+    async def _work(self, loop, queue):
+        while True:
+            item = await queue.get()
+            if item is None:
+                #Pass the shutdown marker on to the next worker.
+                await queue.put(None)
+                return
+            await self._handle(loop, *item)
+
+    #Consume the stream until stop() is called (or max_events have been
+    #handled), then return the latency summary.
+    async def run(self, max_events=None):
+        loop = asyncio.get_event_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        reader = threading.Thread(target=self._read, args=(loop, queue))
+        reader.daemon = True
+        reader.start()
+        workers = [loop.create_task(self._work(loop, queue))
+                   for _ in range(self.workers)]
+        while not self._stop.is_set():
+            if max_events is not None and self.events_seen >= max_events:
+                self.stop()
+            await asyncio.sleep(0.01)
+        #The reader may be stuck waiting on a quiet connection, so don't wait
+        #for it to notice; tell the workers to finish up ourselves.
+        await queue.put(None)
+        await asyncio.gather(*workers)
+        return self.stats.summary()
+
+
+#Handlers for the bot. like_tweets likes every tweet that comes in, and
+#follow_back follows anyone who follows us.
+def like_tweets(api):
+    def handle(event):
+        api.create_favorite(event["id"])
+    return handle
+
+
+#A user stream sends "follow" both when someone follows us and when we follow
+#someone (including our own follow backs), so only act when we're the target.
+#user_id is our own account id; by default it's looked up once here.
+def follow_back(api, user_id=None):
+    me = str(user_id if user_id is not None else api.verify_credentials().id)
+
+    def handle(event):
+        source = event.get("source") or {}
+        target = event.get("target") or {}
+        if (source.get("id") is not None and str(target.get("id")) == me and
+                str(source["id"]) != me):
+            api.create_friendship(user_id=source["id"])
+    return handle
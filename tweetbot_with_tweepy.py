@@ -83,3 +83,77 @@ for block in api.blocks():
     print(block.name)
 
 #Methods for Searches
+
+#Paging through everything
+
+#Each of the calls above only returns the first page of results, like the last
+#20 followers. tweepy_streaming pages through the whole list lazily, handing
+#back one item at a time and fetching the next page in the background while we
+#work on the current one:
+
+#import tweepy_streaming
+#for follower in tweepy_streaming.followers(api, "justanesta"):
+    #print(follower.name)
+#for tweet in tweepy_streaming.home_timeline(api, limit=500):
+    #print(f"{tweet.user.name} said  {tweet.text}")
+#for block in tweepy_streaming.blocks(api):
+    #print(block.name)
+
+#Sharing the rate limit budget
+
+#wait_on_rate_limit=True puts the whole script to sleep as soon as any one
+#endpoint runs out of calls. twitter_rate_limits tracks the budget of each
+#endpoint separately and keeps working on the ones that still have calls left,
+#only sleeping when everything we've queued up is out of budget:
+
+#from twitter_rate_limits import RateLimitScheduler, RateLimitTracker
+#api = tweepy.API(auth, wait_on_rate_limit = False)
+#tracker = RateLimitTracker()
+#tracker.load(api)
+#scheduler = RateLimitScheduler(api, tracker)
+#timeline = scheduler.submit(api.home_timeline)
+#user = scheduler.submit(api.get_user, screen_name="justanesta")
+#scheduler.run()
+#print(user.result().name)
+
+#Looking up many users
+
+#get_user() costs one call per account. lookup_users takes 100 accounts per
+#call, and twitter_hydration batches our handles into those calls, runs a few
+#batches at once within the rate limit and caches users it has already seen:
+
+#from twitter_hydration import UserHydrator
+#hydrator = UserHydrator(api, tracker=tracker)
+#users = hydrator.hydrate(screen_names=["justanesta", "realpython"])
+#for handle, user in users.items():
+    #print(user.name, user.description, user.location)
+
+#Streaming instead of polling
+
+#Calling home_timeline(count=1) over and over to find something new to like
+#wastes calls. tweet_stream reads a streaming endpoint where Twitter pushes
+#events as they happen, one JSON object per line, and hands each one to a
+#handler. It reconnects on its own if the connection drops and keeps track of
+#how quickly each event was handled:
+
+#import asyncio
+#from tweet_stream import StreamIngestor, follow_back, like_tweets
+#ingestor = StreamIngestor("https://userstream.twitter.com/1.1/user.json",
+                          #{"tweet": like_tweets(api), "follow": follow_back(api)},
+                          #auth=auth.apply_auth())
+#print(asyncio.get_event_loop().run_until_complete(ingestor.run(max_events=100)))
+
+#Not repeating ourselves
+
+#Run this script twice and it follows @realpython twice and likes the same
+#tweet twice. tweet_actions queues likes, follows and profile updates, drops
+#ones we've already done (even in an earlier run), and sends the rest within
+#Twitter's write limits. Anything unsent is saved to disk for the next run:
+
+#from tweet_actions import ActionQueue
+#actions = ActionQueue(api, state_dir="bot_state")
+#actions.follow("realpython")
+#actions.update_profile(description="Sitting at the intersection between John Mulaney and Larry David")
+#actions.like(tweet.id)
+#print(actions.run())
+#actions.close()
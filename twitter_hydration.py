@@ -0,0 +1,177 @@
+import concurrent.futures
+import inspect
+import threading
+import time
+
+import tweepy
+
+from api_cache import TTLCache
+from twitter_rate_limits import RateLimitExceeded, RateLimitTracker
+
+#Looking up lots of users at once
+
+#tweetbot_with_tweepy.py looks up one account at a time with
+#api.get_user("justanesta"). That's one API call per user, which is fine for a
+#demo but hopeless when we need details for tens of thousands of handles.
+
+#lookup_users takes up to 100 screen names or ids per call, so UserHydrator
+#groups whatever we ask for into batches of 100 and sends the batches from a
+#few threads at once. Before each batch it checks the /users/lookup budget in a
+#RateLimitTracker and waits for the window to reset if it's used up. A tracker
+#that knows nothing about /users/lookup yet is seeded from rate_limit_status()
+#first, and kept up to date from the x-rate-limit-* headers of each call's
+#own response.
+#A batch that still gets a 429 waits for the reset and is sent again, so one
+#rate limited batch doesn't lose the ones that already came back.
+
+#Users we've seen recently are kept in a TTLCache under both their id and their
+#screen name, so asking for the same people again doesn't cost any calls.
+
+LOOKUP_BATCH_SIZE = 100
+LOOKUP_ENDPOINT = "/users/lookup"
+
+#lookup_users answers 404 (error code 17) when none of the batch exists.
+#tweepy 4 raises NotFound for that; tweepy 3 a TweepError with api_code 17.
+NotFound = getattr(tweepy, "NotFound", None) or getattr(tweepy, "TweepError")
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+#tweepy 4 uses screen_name/user_id for lookup_users, tweepy 3 used
+#screen_names/user_ids.
+def _lookup_argument_names(lookup_users):
+    try:
+        parameters = inspect.signature(lookup_users).parameters
+    except (TypeError, ValueError):
+        parameters = {}
+    if "screen_names" in parameters:
+        return "screen_names", "user_ids"
+    return "screen_name", "user_id"
+
+
+class UserHydrator(object):
+
+    def __init__(self, api, cache=None, tracker=None, workers=4,
+                 batch_size=LOOKUP_BATCH_SIZE, sleep=time.sleep):
+        self.api = api
+        self.cache = cache if cache is not None else TTLCache(
+            maxsize=100000, ttl=6 * 60 * 60)
+        self.tracker = tracker or RateLimitTracker()
+        self.workers = workers
+        self.batch_size = batch_size
+        self.sleep = sleep
+        self.calls = 0
+        self._budget_lock = threading.Lock()
+        self._seeded = False
+        self._names = _lookup_argument_names(api.lookup_users)
+        self._responses = threading.local()
+        self._call_lock = None
+        #api.last_response is shared between our threads, so with tweepy 4 we
+        #catch each response on its way back through api.session, in the
+        #thread that asked for it. tweepy 3 makes a new session per call, so
+        #there we hold a lock over each call and its last_response instead.
+        session = getattr(api, "session", None)
+        if session is not None and hasattr(session, "hooks"):
+            session.hooks.setdefault("response", []).append(self._keep)
+        else:
+            self._call_lock = threading.Lock()
+
+    def _keep(self, response, *args, **kwargs):
+        self._responses.last = response
+
+    def _remember(self, user):
+        self.cache.set(("id", int(user.id)), user)
+        self.cache.set(("screen_name", user.screen_name.lower()), user)
+
+    #Ask rate_limit_status() for the real numbers once, unless the tracker
+    #already has them. If that fails too, the response headers will do.
+    def _seed(self):
+        if self._seeded:
+            return
+        self._seeded = True
+        if self.tracker.get(LOOKUP_ENDPOINT) is not None:
+            return
+        try:
+            self.tracker.load(self.api)
+        except Exception:
+            pass
+
+    def _wait_for_budget(self):
+        with self._budget_lock:
+            self._seed()
+            while not self.tracker.can_call(LOOKUP_ENDPOINT):
+                self.sleep(self.tracker.wait_time(LOOKUP_ENDPOINT) + 1)
+            self.tracker.record_call(LOOKUP_ENDPOINT)
+            self.calls += 1
+
+    #One lookup_users call, and the response it came back with.
+    def _call(self, argument, batch):
+        if self._call_lock is not None:
+            with self._call_lock:
+                users = self.api.lookup_users(**{argument: list(batch)})
+                return users, getattr(self.api, "last_response", None)
+        self._responses.last = None
+        users = self.api.lookup_users(**{argument: list(batch)})
+        return users, self._responses.last
+
+    def _lookup(self, kind, batch):
+        argument = self._names[0] if kind == "screen_name" else self._names[1]
+        while True:
+            self._wait_for_budget()
+            try:
+                users, response = self._call(argument, batch)
+                break
+            except RateLimitExceeded as error:
+                self.tracker.exhaust_from_error(LOOKUP_ENDPOINT, error)
+            except NotFound as error:
+                #tweepy 3's TweepError covers every error, so check the code.
+                if (NotFound is getattr(tweepy, "TweepError", None) and
+                        getattr(error, "api_code", None) != 17):
+                    raise
+                #Nobody in this batch exists. Still a call against the
+                #budget, but nothing to return.
+                return []
+        if response is not None:
+            self.tracker.update_from_headers(LOOKUP_ENDPOINT,
+                                             response.headers)
+        for user in users:
+            self._remember(user)
+        return users
+
+    #Return {screen name or id: user} for everything asked for. Accounts that
+    #don't exist or are suspended are simply left out, the same way
+    #lookup_users leaves them out.
+    def hydrate(self, screen_names=(), user_ids=()):
+        wanted = [("screen_name", key, key.lower()) for key in screen_names]
+        wanted += [("id", key, int(key)) for key in user_ids]
+
+        resolved = {}
+        missing = {"screen_name": [], "id": []}
+        for kind, key, normalized in wanted:
+            if (kind, normalized) in resolved:
+                continue
+            user = self.cache.get((kind, normalized))
+            resolved[(kind, normalized)] = user
+            if user is None:
+                missing[kind].append(normalized)
+
+        jobs = [(kind, batch) for kind, keys in missing.items()
+                for batch in _chunks(keys, self.batch_size)]
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+            for users in pool.map(lambda job: self._lookup(*job), jobs):
+                for user in users:
+                    resolved[("id", int(user.id))] = user
+                    resolved[("screen_name", user.screen_name.lower())] = user
+
+        found = {}
+        for kind, key, normalized in wanted:
+            user = resolved.get((kind, normalized))
+            if user is not None:
+                found[key] = user
+        return found
+
+    def get_user(self, screen_name):
+        return self.hydrate(screen_names=[screen_name]).get(screen_name)
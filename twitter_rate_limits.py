@@ -0,0 +1,206 @@
+import collections
+import concurrent.futures
+import threading
+import time
+
+import tweepy
+
+#Rate limit budgeting for the tweet bot
+
+#tweetbot_with_tweepy.py builds its API object with wait_on_rate_limit=True.
+#That's the easy option, but when any single endpoint runs out, tweepy puts
+#the whole program to sleep, even if every other endpoint still has plenty of
+#calls left. Twitter gives each endpoint its own 15 minute window, so running
+#out of home_timeline calls says nothing about get_user or followers.
+
+#RateLimitTracker keeps track of the remaining calls and reset time for each
+#endpoint. It reads them from api.rate_limit_status() and then keeps them up to
+#date from the x-rate-limit-* headers on every response.
+
+#RateLimitScheduler takes jobs for any number of endpoints and runs them round
+#robin, skipping endpoints that are out of budget. It only sleeps when every
+#endpoint with work queued is exhausted, and then only until the earliest
+#reset. Build the API object with wait_on_rate_limit=False when using it,
+#otherwise tweepy will still do its own sleeping underneath us.
+
+#Method names mapped to the resource names Twitter uses in rate_limit_status.
+ENDPOINTS = {
+    "home_timeline": "/statuses/home_timeline",
+    "user_timeline": "/statuses/user_timeline",
+    "get_status": "/statuses/show/:id",
+    "get_user": "/users/show/:id",
+    "lookup_users": "/users/lookup",
+    "followers": "/followers/list",
+    "get_followers": "/followers/list",
+    "followers_ids": "/followers/ids",
+    "get_follower_ids": "/followers/ids",
+    "blocks": "/blocks/list",
+    "get_blocks": "/blocks/list",
+    "search": "/search/tweets",
+    "search_tweets": "/search/tweets",
+    "rate_limit_status": "/application/rate_limit_status",
+}
+
+#tweepy 4 calls it TooManyRequests, tweepy 3 called it RateLimitError.
+RateLimitExceeded = getattr(tweepy, "TooManyRequests", None) or getattr(
+    tweepy, "RateLimitError")
+
+EndpointBudget = collections.namedtuple("EndpointBudget",
+                                        ["limit", "remaining", "reset"])
+
+
+def endpoint_for(method):
+    name = getattr(method, "__name__", method)
+    return ENDPOINTS.get(name, name)
+
+
+class RateLimitTracker(object):
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._budgets = {}
+        self._lock = threading.Lock()
+
+    #Seed the tracker from rate_limit_status(), which lists every endpoint.
+    def load(self, api):
+        status = api.rate_limit_status()
+        for family in status.get("resources", {}).values():
+            for endpoint, budget in family.items():
+                self.set(endpoint, budget["limit"], budget["remaining"],
+                         budget["reset"])
+
+    #limit may be None when we don't know it, e.g. after a 429 on an
+    #endpoint we had never heard from.
+    def set(self, endpoint, limit, remaining, reset):
+        with self._lock:
+            self._budgets[endpoint] = EndpointBudget(
+                int(limit) if limit is not None else None, int(remaining),
+                float(reset))
+
+    #Update from the x-rate-limit-* headers of a response. Anything missing
+    #keeps its previous value.
+    def update_from_headers(self, endpoint, headers):
+        remaining = headers.get("x-rate-limit-remaining")
+        if remaining is None:
+            return
+        current = self.get(endpoint)
+        self.set(endpoint,
+                 headers.get("x-rate-limit-limit",
+                             current.limit if current else remaining),
+                 remaining,
+                 headers.get("x-rate-limit-reset",
+                             current.reset if current else self.clock()))
+
+    #Returns the endpoint's budget, rolling it over if its window has reset.
+    #If we never learned the limit, a reset window leaves us knowing nothing,
+    #so the budget is forgotten and None returned, as for a new endpoint.
+    def get(self, endpoint):
+        with self._lock:
+            budget = self._budgets.get(endpoint)
+            if budget is not None and budget.reset <= self.clock():
+                if budget.limit is None:
+                    del self._budgets[endpoint]
+                    return None
+                budget = EndpointBudget(budget.limit, budget.limit,
+                                        self.clock() + 15 * 60)
+                self._budgets[endpoint] = budget
+            return budget
+
+    #{endpoint: EndpointBudget} for everything we know about.
+    def budgets(self):
+        with self._lock:
+            return dict(self._budgets)
+
+    #Endpoints we haven't heard about yet are assumed to have budget; the
+    #first response will tell us the real numbers.
+    def can_call(self, endpoint):
+        budget = self.get(endpoint)
+        return budget is None or budget.remaining > 0
+
+    def record_call(self, endpoint):
+        with self._lock:
+            budget = self._budgets.get(endpoint)
+            if budget is not None:
+                self._budgets[endpoint] = budget._replace(
+                    remaining=max(budget.remaining - 1, 0))
+
+    def exhaust(self, endpoint, reset=None, limit=None):
+        current = self.get(endpoint)
+        if reset is None:
+            reset = current.reset if current else self.clock() + 15 * 60
+        if limit is None and current is not None:
+            limit = current.limit
+        self.set(endpoint, limit, 0, reset)
+
+    #Mark the endpoint used up after a RateLimitExceeded, with the reset time
+    #and limit from the 429 response if it carried them.
+    def exhaust_from_error(self, endpoint, error):
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        reset = headers.get("x-rate-limit-reset")
+        self.exhaust(endpoint, float(reset) if reset is not None else None,
+                     headers.get("x-rate-limit-limit"))
+
+    #Seconds until the endpoint has budget again (0 if it has some now).
+    def wait_time(self, endpoint):
+        budget = self.get(endpoint)
+        if budget is None or budget.remaining > 0:
+            return 0.0
+        return max(budget.reset - self.clock(), 0.0)
+
+
+class RateLimitScheduler(object):
+
+    def __init__(self, api, tracker=None, sleep=time.sleep):
+        self.api = api
+        self.tracker = tracker or RateLimitTracker()
+        self.sleep = sleep
+        self._queues = collections.OrderedDict()
+
+    #Queue method(*args, **kwargs) and get back a Future for its result.
+    #method is an API method like api.get_user; endpoint can be given
+    #explicitly for anything not in ENDPOINTS.
+    def submit(self, method, *args, **kwargs):
+        endpoint = kwargs.pop("endpoint", None) or endpoint_for(method)
+        future = concurrent.futures.Future()
+        self._queues.setdefault(endpoint, collections.deque()).append(
+            (future, method, args, kwargs))
+        return future
+
+    def pending(self):
+        return sum(len(jobs) for jobs in self._queues.values())
+
+    def _call(self, endpoint, future, method, args, kwargs):
+        self.tracker.record_call(endpoint)
+        try:
+            result = method(*args, **kwargs)
+        except RateLimitExceeded as error:
+            #Out of budget after all. Leave the job queued and note when the
+            #window resets.
+            self.tracker.exhaust_from_error(endpoint, error)
+            return False
+        except Exception as error:
+            future.set_exception(error)
+            return True
+        response = getattr(self.api, "last_response", None)
+        if response is not None:
+            self.tracker.update_from_headers(endpoint, response.headers)
+        future.set_result(result)
+        return True
+
+    #Run every queued job. Each pass takes one job from each endpoint that has
+    #budget left, so a starved endpoint never holds up the others.
+    def run(self):
+        while self.pending():
+            ran = False
+            for endpoint, jobs in list(self._queues.items()):
+                if not jobs or not self.tracker.can_call(endpoint):
+                    continue
+                future, method, args, kwargs = jobs[0]
+                if self._call(endpoint, future, method, args, kwargs):
+                    jobs.popleft()
+                ran = True
+            if not ran:
+                waits = [self.tracker.wait_time(endpoint)
+                         for endpoint, jobs in self._queues.items() if jobs]
+                self.sleep(min(waits) + 1)
@@ -1,12 +1,15 @@
-import json
 import requests
 
+import json_codec
+
 r = requests.get(
     "http://gdata.youtube.com/feeds/api/standardfeeds/top_rated?v=2&alt=jsonc")
 
 r.text
 
-data = json.loads(r.text)
+#json_codec.loads reads the raw bytes in r.content directly, using orjson
+#when it's installed, instead of decoding r.text into a string first.
+data = json_codec.loads(r.content)
 
 for item in data['data']['items']:
     print("Video Title: %s" % (item['title']))
@@ -18,3 +21,12 @@ for item in data['data']['items']:
 
     print("Embed URL: %s" % (item['player']['default']))
     
+
+#That only gets the first page of the feed. youtube_feed.FeedClient pages
+#through the whole feed, fetching several pages at once, caches the pages for
+#a few minutes, and keeps just these five fields of each video:
+
+from youtube_feed import FeedClient
+feed = FeedClient()
+for video in feed.videos("top_rated", limit=200):
+    print("%s | %s | %s | %s | %s" % video)
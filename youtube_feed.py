@@ -0,0 +1,94 @@
+import collections
+import concurrent.futures
+
+import requests
+
+import json_codec
+from api_cache import TTLCache
+
+#Paging through a YouTube feed
+
+#youtube_api.py gets one page of the top_rated feed, decodes all of it, and
+#prints five fields of each video. FeedClient does the same for as many
+#videos as we want:
+
+#  - the feed is paged with start-index/max-results. The first page tells us
+#    totalItems, and the rest of the pages are then fetched from a few
+#    threads at once.
+#  - each item is cut down to a Video record with just the five fields we
+#    print as soon as it's decoded, so we don't hold on to whole responses.
+#  - pages are kept in a TTLCache, so running the same listing again within
+#    ttl seconds doesn't hit the API at all.
+
+#base_url is the feed root, so the client can be pointed at a local server
+#that replays recorded feed JSON, e.g.
+#FeedClient("http://127.0.0.1:8000/feeds/api").
+
+BASE_URL = "http://gdata.youtube.com/feeds/api"
+
+#The most the v2 API returns per page.
+MAX_RESULTS = 50
+
+Video = collections.namedtuple("Video", ["title", "category", "id", "rating",
+                                         "player"])
+
+
+def video_record(item):
+    return Video(item.get("title"), item.get("category"), item.get("id"),
+                 item.get("rating"), (item.get("player") or {}).get("default"))
+
+
+class FeedClient(object):
+
+    def __init__(self, base_url=BASE_URL, session=None, cache=None,
+                 workers=4, page_size=MAX_RESULTS, ttl=600, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.session = session or requests.Session()
+        self.cache = cache if cache is not None else TTLCache(maxsize=1000,
+                                                              ttl=ttl)
+        self.workers = workers
+        self.page_size = min(page_size, MAX_RESULTS)
+        self.timeout = timeout
+        self.requests = 0
+
+    def feed_url(self, feed):
+        return "%s/standardfeeds/%s" % (self.base_url, feed)
+
+    #One page as (totalItems, [Video]). start_index counts from 1.
+    def page(self, feed, start_index=1, max_results=None):
+        max_results = max_results or self.page_size
+        key = (feed, start_index, max_results)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        self.requests += 1
+        response = self.session.get(self.feed_url(feed), params={
+            "v": 2, "alt": "jsonc", "start-index": start_index,
+            "max-results": max_results}, timeout=self.timeout)
+        response.raise_for_status()
+        data = json_codec.decode_response(response)["data"]
+        page = (int(data.get("totalItems", 0)),
+                [video_record(item) for item in data.get("items", ())])
+        self.cache.set(key, page)
+        return page
+
+    #Every video in the feed (or the first limit), in feed order.
+    def videos(self, feed="top_rated", limit=None):
+        total, first = self.page(feed, 1, self._size(1, limit))
+        if limit is not None:
+            total = min(total, limit)
+        videos = list(first[:total])
+        starts = list(range(1 + len(first), total + 1, self.page_size))
+        if not starts or not first:
+            return videos
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+            pages = pool.map(lambda start: self.page(
+                feed, start, self._size(start, total))[1], starts)
+            for page in pages:
+                videos.extend(page)
+        return videos[:total]
+
+    def _size(self, start, limit):
+        if limit is None:
+            return self.page_size
+        return max(1, min(self.page_size, limit - start + 1))